@@ -21,47 +21,370 @@ import gi
 import gc
 import signal
 import time, sys, subprocess, re, os
+import argparse
+import bisect
+import collections
+import configparser
+import ctypes
+import gzip
+import hashlib
+import heapq
+import itertools
+import math
+import mmap
+import platform
+import queue
+import resource
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import traceback
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import dbus
 import json
 
-gi.require_version('Gtk', '3.0')
-gi.require_version('AppIndicator3', '0.1')
-
 from dbus.mainloop.glib import DBusGMainLoop
-from gi.repository import AppIndicator3, Gdk, Gio, GLib, Gtk
-from gi.repository.GdkPixbuf import InterpType, Pixbuf
+from gi.repository import Gio, GLib
+try:
+    gi.require_version('Gtk', '3.0')
+    gi.require_version('AppIndicator3', '0.1')
+    from gi.repository import AppIndicator3, Gdk, Gtk
+    from gi.repository.GdkPixbuf import InterpType, Pixbuf
+except (ImportError, ValueError) as e:
+    # --history, --replay and --bench run without a desktop
+    AppIndicator3 = Gdk = Gtk = InterpType = Pixbuf = None
+    NO_DESKTOP = e
+else:
+    NO_DESKTOP = None
 
 def log(msg):
+    if log.quiet:
+        return
     now = datetime.now()
-    print("{}: {}".format(now.strftime("%Y-%m-%d-%H:%M:%S"), msg))
+    print("{}: {}".format(now.strftime("%Y-%m-%d-%H:%M:%S"), msg),
+          file=log.file)
+log.quiet = False
+log.file = None # stdout
 
 class ExecutionError(Exception):
     pass
 
+class MainLoop:
+    '''
+    The clock and timer sources the application logic runs on.
+
+    This is a thin shim over GLib so the same logic can be driven by
+    VirtualLoop when replaying a trace.
+    '''
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def timeout_add(self, interval_ms, callback, *args):
+        return GLib.timeout_add(interval_ms, profiled(callback), *args)
+
+    def timeout_add_seconds(self, interval, callback, *args):
+        return GLib.timeout_add_seconds(interval, profiled(callback), *args)
+
+    def source_remove(self, source):
+        GLib.source_remove(source)
+
+class VirtualLoop(MainLoop):
+    '''
+    A MainLoop with a simulated clock: run_until() fires every due timer
+    in order and jumps time forward instead of sleeping.
+    '''
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+        self.epoch = self.now
+        self.queue = []
+        self.cancelled = set()
+        self.ids = itertools.count(1)
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.epoch
+
+    def _schedule(self, interval, callback, args):
+        source = next(self.ids)
+        heapq.heappush(self.queue,
+                       (self.now + interval, source, interval, callback, args))
+        return source
+
+    def timeout_add(self, interval_ms, callback, *args):
+        return self._schedule(interval_ms / 1000, callback, args)
+
+    def timeout_add_seconds(self, interval, callback, *args):
+        return self._schedule(interval, callback, args)
+
+    def source_remove(self, source):
+        self.cancelled.add(source)
+
+    def run_until(self, until):
+        while self.queue and self.queue[0][0] <= until:
+            when, source, interval, callback, args = heapq.heappop(self.queue)
+            if source in self.cancelled:
+                self.cancelled.discard(source)
+                continue
+            self.now = when
+            if callback(*args):
+                heapq.heappush(self.queue,
+                               (when + interval, source, interval, callback, args))
+        self.now = max(self.now, until)
+
+class Profiler:
+    '''
+    Opt-in instrumentation of the main loop.
+
+    Every callback registered through profiled() records its wall and CPU
+    time by name.  A watchdog thread snapshots the main thread's stack when
+    a callback runs past slow_ms, and dumps it when the loop has not turned
+    over (the heartbeat timer has not fired) for stall_ms.  report() logs
+    the totals and is bound to SIGUSR2.
+    '''
+    active = None
+    SLOW_MS = 100
+    STALL_MS = 1000
+    HEARTBEAT_MS = 100
+    SNAPSHOTS = 20
+
+    def __init__(self, slow_ms=None, stall_ms=None):
+        self.slow = (slow_ms or self.SLOW_MS) / 1000
+        self.stall = (stall_ms or self.STALL_MS) / 1000
+        self.stats = {}
+        self.snapshots = collections.deque(maxlen=self.SNAPSHOTS)
+        self.current = None
+        self.beat = time.monotonic()
+        self.main_thread = threading.get_ident()
+
+    def install(self):
+        Profiler.active = self
+        GLib.timeout_add(self.HEARTBEAT_MS, self.heartbeat)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, self.report)
+        threading.Thread(target=self.watch, name='stall-watchdog',
+                         daemon=True).start()
+        log(f"profiling callbacks (slow {self.slow * 1000:.0f} ms, "
+            f"stall {self.stall * 1000:.0f} ms); kill -USR2 {os.getpid()} "
+            "for a report")
+        return self
+
+    def heartbeat(self):
+        self.beat = time.monotonic()
+        return GLib.SOURCE_CONTINUE
+
+    def wrap(self, callback):
+        name = getattr(callback, '__qualname__', repr(callback))
+
+        def profiled_callback(*args, **kwargs):
+            outer = self.current
+            started = time.perf_counter()
+            cpu = time.thread_time()
+            self.current = [name, time.monotonic(), False]
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - started
+                cpu = time.thread_time() - cpu
+                self.current = outer
+                stat = self.stats.setdefault(name, [0, 0.0, 0.0, 0.0, 0])
+                stat[0] += 1
+                stat[1] += wall
+                stat[2] += cpu
+                stat[3] = max(stat[3], wall)
+                if wall > self.slow:
+                    stat[4] += 1
+                    log(f"profile: {name} took {wall * 1000:.0f} ms "
+                        f"({cpu * 1000:.0f} ms cpu)")
+        return profiled_callback
+
+    def main_stack(self):
+        frame = sys._current_frames().get(self.main_thread)
+        return ''.join(traceback.format_stack(frame)) if frame else ''
+
+    def watch(self):
+        stalled = False
+        while True:
+            time.sleep(min(self.slow, self.stall) / 4)
+            now = time.monotonic()
+            current = self.current
+            if current is not None and not current[2] \
+                    and now - current[1] > self.slow:
+                current[2] = True
+                self.snapshots.append((current[0], self.main_stack()))
+            if now - self.beat > self.stall:
+                if not stalled:
+                    stalled = True
+                    name = current[0] if current else "(no callback)"
+                    log(f"profile: main loop stalled for {now - self.beat:.1f}s "
+                        f"in {name}:\n{self.main_stack()}")
+            else:
+                stalled = False
+
+    def report(self):
+        log("profile: callback             calls   total ms     avg ms"
+            "     max ms     cpu ms  slow")
+        for name, (calls, wall, cpu, longest, slow) in sorted(
+                self.stats.items(), key=lambda item: -item[1][1]):
+            log("profile: {:<20} {:>7} {:>10.1f} {:>10.2f} {:>10.1f} {:>10.1f} {:>5}"
+                .format(name[-20:], calls, wall * 1000, wall * 1000 / calls,
+                        longest * 1000, cpu * 1000, slow))
+        for name, stack in self.snapshots:
+            log(f"profile: slow {name}:\n{stack}")
+        return GLib.SOURCE_CONTINUE
+
+def profiled(callback):
+    '''wrap a main-loop callback for the profiler, when one is installed'''
+    if Profiler.active is None:
+        return callback
+    return Profiler.active.wrap(callback)
+
 class ScreensaverStatus():
+    '''
+    Screen lock state from whichever source this desktop provides.
+
+    The providers are tried in order with a name-owner check, and the first
+    one with an owner is followed through its signals alone; its initial
+    state is fetched asynchronously.  logind's Session.LockedHint on the
+    system bus is the fallback.  is_locked() means nothing until the state
+    is known, which the ready_callback() handler is told; lock and unlock
+    handlers only see changes after that.
+    '''
     IDLE = 60 # seconds
-    def __init__(self, bus):
+    # provider: (bus name, object path, method interface, signal interface)
+    PROVIDERS = {
+        'kde': ('org.kde.screensaver', '/org/freedesktop/ScreenSaver',
+                'org.freedesktop.ScreenSaver', 'org.kde.screensaver'),
+        'gnome': ('org.gnome.ScreenSaver', '/org/gnome/ScreenSaver',
+                  'org.gnome.ScreenSaver', 'org.gnome.ScreenSaver'),
+        'freedesktop': ('org.freedesktop.ScreenSaver',
+                        '/org/freedesktop/ScreenSaver',
+                        'org.freedesktop.ScreenSaver',
+                        'org.freedesktop.ScreenSaver'),
+    }
+    LOGIND = 'logind'
+
+    def __init__(self, bus, system_bus=None, provider='auto',
+                 clock=time.monotonic):
         self.bus = bus
+        self.system_bus = system_bus
+        self.clock = clock
         self.unlock_handler = None
         self.lock_handler = None
-        self.bus.add_signal_receiver(self._active_changed,
-                                     dbus_interface='org.kde.screensaver',
+        self.ready_handler = None
+        self.ready = False
+        self._is_active = False
+        self.signalled = False
+        self.changed_at = None
+        self.provider = None
+        if provider not in (None, 'auto', self.LOGIND, *self.PROVIDERS):
+            log(f"unknown screensaver_provider {provider!r}, using auto")
+            provider = 'auto'
+        if provider in (None, 'auto'):
+            candidates = list(self.PROVIDERS) + [self.LOGIND]
+        else:
+            candidates = [provider]
+        for name in candidates:
+            if name == self.LOGIND:
+                if self.system_bus is not None:
+                    self._follow_logind()
+                    break
+            elif len(candidates) == 1 or self.bus.name_has_owner(
+                    self.PROVIDERS[name][0]):
+                self._follow(name)
+                break
+        if self.provider is None:
+            log("no screen lock source found, lock state is not followed")
+            self._ready()
+        else:
+            log(f"following screen lock through {self.provider}")
+
+    def _follow(self, name):
+        self.provider = name
+        bus_name, path, interface, signal_interface = self.PROVIDERS[name]
+        self.bus.add_signal_receiver(profiled(self._active_changed),
+                                     dbus_interface=signal_interface,
                                      signal_name='ActiveChanged',
-                                     bus_name='org.kde.screensaver')
+                                     bus_name=bus_name)
+        self.bus.get_object(bus_name, path, introspect=False).GetActive(
+                dbus_interface=interface,
+                reply_handler=profiled(self._initial_state),
+                error_handler=profiled(self._error))
+
+    def _follow_logind(self):
+        self.provider = self.LOGIND
+        manager = self.system_bus.get_object('org.freedesktop.login1',
+                                             '/org/freedesktop/login1',
+                                             introspect=False)
+        manager.GetSession('auto',
+                           dbus_interface='org.freedesktop.login1.Manager',
+                           reply_handler=profiled(self._logind_session),
+                           error_handler=profiled(self._error))
+
+    def _logind_session(self, path):
+        self.system_bus.add_signal_receiver(
+                profiled(self._logind_changed),
+                dbus_interface='org.freedesktop.DBus.Properties',
+                signal_name='PropertiesChanged',
+                bus_name='org.freedesktop.login1', path=path)
+        session = self.system_bus.get_object('org.freedesktop.login1', path,
+                                             introspect=False)
+        session.Get('org.freedesktop.login1.Session', 'LockedHint',
+                    dbus_interface='org.freedesktop.DBus.Properties',
+                    reply_handler=profiled(self._initial_state),
+                    error_handler=profiled(self._error))
+
+    def _logind_changed(self, interface, changed, invalidated):
+        if interface != 'org.freedesktop.login1.Session':
+            return
+        if 'LockedHint' in changed and bool(changed['LockedHint']) != self._is_active:
+            self._active_changed(changed['LockedHint'])
 
-        self._is_active = self.bus.call_blocking('org.kde.screensaver',
-                                      '/org/freedesktop/ScreenSaver',
-                                      'org.freedesktop.ScreenSaver',
-                                      'GetActive', '', [])
+    def _initial_state(self, is_active):
+        # a signal that beat the reply is more recent
+        if self.signalled:
+            return
+        log(f"{self.provider} initial state -> {bool(is_active)}")
+        self._is_active = bool(is_active)
+        self._ready()
+
+    def _error(self, e):
+        log(f"{self.provider}: cannot read the lock state: {e}")
+        # carry on as unlocked rather than never deciding
+        self._ready()
+
+    def _ready(self):
+        if self.ready:
+            return
+        self.ready = True
+        if self.ready_handler:
+            self.ready_handler()
+
+    def latency(self, locked):
+        '''seconds since the last lock (or unlock) signal, reported once'''
+        if self.changed_at is None or self._is_active != locked:
+            return None
+        elapsed, self.changed_at = self.clock() - self.changed_at, None
+        return elapsed
 
     def is_locked(self):
         return self._is_active
 
     def _active_changed(self, is_active):
-        log(f"org.kde.screensaver ActiveChanged -> {is_active}")
-        self._is_active = is_active
+        log(f"{self.provider} ActiveChanged -> {is_active}")
+        self._is_active = bool(is_active)
+        self.signalled = True
+        self.changed_at = self.clock()
+        if not self.ready:
+            # the first state known, not a change to act on twice
+            self._ready()
+            return
         if is_active:
             if self.lock_handler:
                 log("calling lock_handler")
@@ -81,6 +404,12 @@ class ScreensaverStatus():
             return
         self.lock_handler = handler
 
+    def ready_callback(self, handler):
+        '''call handler once the lock state is known, maybe right away'''
+        self.ready_handler = handler
+        if self.ready:
+            handler()
+
 class ScreensaverInhibit:
     def __init__(self, bus):
         self.cookie = None
@@ -97,6 +426,186 @@ class ScreensaverInhibit:
                 os.getpid(), self.cookie))
             self.iface.UnInhibit(self.cookie)
 
+class IdleMonitor:
+    '''
+    Session idle time from signals rather than polling.
+
+    Mutter's IdleMonitor fires a watch once the user has been idle for each
+    threshold, and a one-shot watch on the next input.  Elsewhere logind's
+    Session.IdleHint is followed, and the desktop's own idle delay then
+    stands in for every threshold.  A watch's id is only known once Mutter
+    replies, so ids that fire before that are kept and matched on the reply.
+    '''
+    def __init__(self, bus, system_bus, thresholds, idle_handler,
+                 active_handler):
+        self.bus = bus
+        self.system_bus = system_bus
+        self.thresholds = sorted(set(thresholds))
+        self.idle_handler = idle_handler
+        self.active_handler = active_handler
+        self.watches = {}
+        self.active_watch = None
+        self.fired = set() # unknown ids fired while idle
+        self.idle = False
+        self.provider = None
+        if self.bus.name_has_owner('org.gnome.Mutter.IdleMonitor'):
+            self._follow_mutter()
+        elif self.system_bus is not None:
+            self._follow_logind()
+        if self.provider is None:
+            log("no idle monitor found, idle policy is off")
+        else:
+            log(f"following session idle time through {self.provider}")
+
+    def _follow_mutter(self):
+        self.provider = 'mutter'
+        path = '/org/gnome/Mutter/IdleMonitor/Core'
+        self.monitor = dbus.Interface(
+                self.bus.get_object('org.gnome.Mutter.IdleMonitor', path,
+                                    introspect=False),
+                'org.gnome.Mutter.IdleMonitor')
+        self.bus.add_signal_receiver(profiled(self._watch_fired),
+                                     dbus_interface='org.gnome.Mutter.IdleMonitor',
+                                     signal_name='WatchFired',
+                                     bus_name='org.gnome.Mutter.IdleMonitor',
+                                     path=path)
+        for seconds in self.thresholds:
+            self.monitor.AddIdleWatch(
+                    dbus.UInt64(seconds * 1000),
+                    reply_handler=profiled(
+                        lambda watch, seconds=seconds:
+                            self.watches.__setitem__(watch, seconds)),
+                    error_handler=profiled(self._error))
+
+    def _watch_fired(self, watch):
+        if watch == self.active_watch:
+            self.active_watch = None
+            self._active()
+        elif watch in self.watches:
+            if not self.idle:
+                self.idle = True
+                self.monitor.AddUserActiveWatch(
+                        reply_handler=profiled(self._active_watch_added),
+                        error_handler=profiled(self._error))
+            self._idle(self.watches[watch])
+        elif self.idle and self.active_watch is None:
+            # input may have beaten the AddUserActiveWatch reply
+            self.fired.add(watch)
+
+    def _active_watch_added(self, watch):
+        fired, self.fired = self.fired, set()
+        if watch in fired:
+            self._active()
+        else:
+            self.active_watch = watch
+
+    def _follow_logind(self):
+        self.provider = 'logind'
+        manager = self.system_bus.get_object('org.freedesktop.login1',
+                                             '/org/freedesktop/login1',
+                                             introspect=False)
+        manager.GetSession('auto',
+                           dbus_interface='org.freedesktop.login1.Manager',
+                           reply_handler=profiled(self._logind_session),
+                           error_handler=profiled(self._error))
+
+    def _logind_session(self, path):
+        self.system_bus.add_signal_receiver(
+                profiled(self._logind_changed),
+                dbus_interface='org.freedesktop.DBus.Properties',
+                signal_name='PropertiesChanged',
+                bus_name='org.freedesktop.login1', path=path)
+
+    def _logind_changed(self, interface, changed, invalidated):
+        if interface != 'org.freedesktop.login1.Session' or 'IdleHint' not in changed:
+            return
+        if changed['IdleHint'] and not self.idle:
+            self.idle = True
+            for seconds in self.thresholds:
+                self._idle(seconds)
+        elif not changed['IdleHint'] and self.idle:
+            self._active()
+
+    def _idle(self, seconds):
+        log(f"{self.provider}: idle for {seconds}s")
+        self.idle_handler(seconds)
+
+    def _active(self):
+        self.idle = False
+        log(f"{self.provider}: user active")
+        self.active_handler()
+
+    def _error(self, e):
+        log(f"{self.provider}: idle watch failed: {e}")
+
+class SleepMonitor:
+    '''
+    Follows logind's PrepareForSleep signal on the system bus.
+
+    A delay inhibitor is held while awake, so the daemon can be stopped
+    cleanly before the machine sleeps.  It is released as soon as that is
+    done, and taken again on wake.  Every call to logind is asynchronous so
+    a slow or missing logind never blocks the main loop.  Set
+    DBUS_SYSTEM_BUS_ADDRESS to point this at a private bus running a fake
+    logind.
+    '''
+    def __init__(self, bus, sleep_handler, wake_handler):
+        self.bus = bus
+        self.fd = None
+        self.pending = False
+        self.sleeping = False
+        self.sleep_handler = sleep_handler
+        self.wake_handler = wake_handler
+        self.manager = dbus.Interface(
+                self.bus.get_object('org.freedesktop.login1',
+                                    '/org/freedesktop/login1',
+                                    introspect=False),
+                'org.freedesktop.login1.Manager')
+        self.bus.add_signal_receiver(profiled(self._prepare_for_sleep),
+                                     dbus_interface='org.freedesktop.login1.Manager',
+                                     signal_name='PrepareForSleep',
+                                     bus_name='org.freedesktop.login1')
+        self.inhibit()
+
+    def inhibit(self):
+        if self.fd is not None or self.pending:
+            return
+        self.pending = True
+        self.manager.Inhibit('sleep', 'deskflow-applet',
+                             'stop deskflow before sleep', 'delay',
+                             reply_handler=profiled(self._inhibited),
+                             error_handler=profiled(self._inhibit_error))
+
+    def _inhibited(self, fd):
+        self.pending = False
+        fd = fd.take()
+        if self.sleeping or self.fd is not None:
+            # the machine started to sleep while the request was in flight
+            os.close(fd)
+            return
+        self.fd = fd
+
+    def _inhibit_error(self, e):
+        self.pending = False
+        log(f"cannot take a sleep delay inhibitor: {e}")
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _prepare_for_sleep(self, sleeping):
+        log(f"org.freedesktop.login1 PrepareForSleep -> {bool(sleeping)}")
+        self.sleeping = bool(sleeping)
+        if sleeping:
+            try:
+                self.sleep_handler()
+            finally:
+                self.release()
+        else:
+            self.inhibit()
+            self.wake_handler()
+
 class Settings(object):
     def __init__(self, fn, defaults = None):
         self.___fn = fn
@@ -104,7 +613,7 @@ class Settings(object):
         self.___values = {}
         self.load()
     def __getattribute__(self, name):
-        if name.startswith("_Settings___") or name in ['load', 'save', 'values']:
+        if name.startswith("_Settings___") or name in ['load', 'save', 'values', 'get']:
             return super(Settings, self).__getattribute__(name)
         return self.___values[name] or None
     def __setattr__(self, name, value):
@@ -114,6 +623,9 @@ class Settings(object):
         self.save()
     def values(self):
         return self.___values
+    def get(self, name, default=None):
+        value = self.___values.get(name)
+        return default if value is None else value
     def load(self):
         try:
             with open(self.___fn, 'r') as f:
@@ -126,9 +638,998 @@ class Settings(object):
             json.dump(self.___values, f, indent=4)
             f.write("\n")
 
+class ConnectionHistory:
+    '''
+    Append-only journal of connection state transitions.
+
+    Each record is a fixed-size (timestamp, state) pair, so the file is
+    sorted by time and can be bisected without an index.  record() only
+    buffers in memory; flush() appends the batch without an fsync and is
+    run from a slow timer, never from the status tick.  Every flush also
+    stamps the file's mtime as a heartbeat, so a session that ended
+    without close() can be closed at startup by recover().  Only the
+    applet's own flushes stamp it: report() just reads, and compact()
+    keeps the heartbeat across its rewrite.
+    '''
+    FILE = Path.home() / 'var' / 'lib' / 'deskflow-history.dat'
+    RECORD = struct.Struct('<dB')
+    RETENTION_DAYS = 180
+
+    def __init__(self, fn=None, retention_days=None):
+        self.fn = fn or self.FILE
+        self.retention = (retention_days or self.RETENTION_DAYS) * 86400
+        self.pending = []
+        self.last_state = None
+
+    def record(self, state, when=None):
+        if state == self.last_state:
+            return
+        self.last_state = state
+        if when is None:
+            when = time.time()
+        self.pending.append(self.RECORD.pack(when, state))
+
+    def flush(self, now=None):
+        if self.pending:
+            self.fn.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.fn, 'ab') as f:
+                f.write(b''.join(self.pending))
+            self.pending = []
+        try:
+            os.utime(self.fn, None if now is None else (now, now))
+        except FileNotFoundError:
+            pass
+        return GLib.SOURCE_CONTINUE
+
+    def recover(self):
+        '''mark the last session inactive at its final heartbeat if it never closed'''
+        size = self.RECORD.size
+        try:
+            with open(self.fn, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_size < size:
+                    return
+                f.seek((st.st_size // size - 1) * size)
+                when, state = self.RECORD.unpack(f.read(size))
+        except FileNotFoundError:
+            return
+        if state == DeskFlow.INACTIVE:
+            return
+        ended = max(when, st.st_mtime)
+        log("history: last session was not closed, marking it inactive at "
+            f"{datetime.fromtimestamp(ended):%Y-%m-%d %H:%M:%S}")
+        self.pending.append(self.RECORD.pack(ended, DeskFlow.INACTIVE))
+        self.flush(ended)
+
+    def close(self, state, when=None):
+        self.record(state, when)
+        self.flush()
+
+    def _bisect(self, buf, when):
+        size = self.RECORD.size
+        lo, hi = 0, len(buf) // size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.RECORD.unpack_from(buf, mid * size)[0] < when:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def compact(self, now=None):
+        '''drop records older than the retention window and any torn tail'''
+        size = self.RECORD.size
+        try:
+            f = open(self.fn, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            length = st.st_size
+            if length == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                count = length // size
+                cutoff = (now or time.time()) - self.retention
+                first = self._bisect(buf, cutoff)
+                if first == 0 and count * size == length:
+                    return
+                head = b''
+                if 0 < first <= count:
+                    # keep the state that was in effect at the cutoff
+                    state = self.RECORD.unpack_from(buf, (first - 1) * size)[1]
+                    head = self.RECORD.pack(cutoff, state)
+                tail = buf[first * size:count * size]
+        tmp = self.fn.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(head)
+            f.write(tail)
+        # the mtime is recover()'s heartbeat, not the time of the rewrite
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, self.fn)
+        log(f"history: compacted {self.fn} ({first} expired records)")
+
+    def events(self, since, until):
+        '''
+        yield (timestamp, state) for every transition in [since, until),
+        starting with the state that was already in effect at since
+        '''
+        size = self.RECORD.size
+        try:
+            f = open(self.fn, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size < size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                count = len(buf) // size
+                first = self._bisect(buf, since)
+                if first > 0:
+                    yield since, self.RECORD.unpack_from(buf, (first - 1) * size)[1]
+                for i in range(first, count):
+                    when, state = self.RECORD.unpack_from(buf, i * size)
+                    if when >= until:
+                        break
+                    yield when, state
+
+    @staticmethod
+    def percentile(values, pct):
+        '''nearest-rank percentile of sorted values'''
+        if not values:
+            return None
+        rank = max(0, math.ceil(pct * len(values) / 100) - 1)
+        return values[min(rank, len(values) - 1)]
+
+    def summary(self, days, now=None):
+        '''
+        per-day time in each state, drop count and reconnect times
+
+        A drop is an active -> idle transition (the daemon is still running
+        but lost its peer); the reconnect time is how long it took to get
+        back to active.  Stopping the daemon in between cancels the pending
+        reconnect, since that is not a network outage.
+        '''
+        now = now or time.time()
+        midnight = datetime.fromtimestamp(now).replace(
+                hour=0, minute=0, second=0, microsecond=0)
+        start = midnight - timedelta(days=days - 1)
+        bounds = [(start + timedelta(days=d)).timestamp()
+                  for d in range(days + 1)]
+        bounds[-1] = min(bounds[-1], now)
+        stats = [{'day': (start + timedelta(days=d)).strftime("%Y-%m-%d"),
+                  'seconds': [0.0, 0.0, 0.0], 'drops': 0, 'reconnects': []}
+                 for d in range(days)]
+        prev_t, prev_s = None, None
+        dropped_at = None
+
+        def day_of(when):
+            return min(max(bisect.bisect_right(bounds, when) - 1, 0), days - 1)
+
+        def account(t0, t1, state):
+            while t0 < t1:
+                day = day_of(t0)
+                end = t1 if day == days - 1 else min(t1, bounds[day + 1])
+                stats[day]['seconds'][state] += end - t0
+                t0 = end
+
+        for when, state in self.events(bounds[0], now):
+            if prev_s is not None:
+                account(prev_t, when, prev_s)
+                day = stats[day_of(when)]
+                if prev_s == DeskFlow.ACTIVE and state == DeskFlow.IDLE:
+                    day['drops'] += 1
+                    dropped_at = when
+                elif state == DeskFlow.ACTIVE and dropped_at is not None:
+                    day['reconnects'].append(when - dropped_at)
+                    dropped_at = None
+                elif state == DeskFlow.INACTIVE:
+                    dropped_at = None
+            prev_t, prev_s = when, state
+        if prev_s is not None:
+            account(prev_t, now, prev_s)
+        return stats
+
+    def report(self, days, out=sys.stdout):
+        stats = self.summary(days)
+        fmt = "{:<10}  {:>9}  {:>9}  {:>6}  {:>5}  {:>8}  {:>8}  {:>8}"
+        print(fmt.format("day", "connected", "running", "avail", "drops",
+                         "rc p50", "rc p90", "rc p99"), file=out)
+
+        def secs(v):
+            return "-" if v is None else f"{v:.1f}s"
+
+        def hours(v):
+            return f"{v / 3600:.2f}h"
+
+        all_reconnects = []
+        totals = [0.0, 0.0, 0.0]
+        drops = 0
+        for day in stats:
+            active = day['seconds'][DeskFlow.ACTIVE]
+            running = active + day['seconds'][DeskFlow.IDLE]
+            rc = sorted(day['reconnects'])
+            all_reconnects.extend(rc)
+            totals = [a + b for a, b in zip(totals, day['seconds'])]
+            drops += day['drops']
+            avail = f"{100 * active / running:.1f}%" if running else "-"
+            print(fmt.format(day['day'],
+                             hours(active),
+                             hours(running),
+                             avail, day['drops'],
+                             secs(self.percentile(rc, 50)),
+                             secs(self.percentile(rc, 90)),
+                             secs(self.percentile(rc, 99))), file=out)
+        active = totals[DeskFlow.ACTIVE]
+        running = active + totals[DeskFlow.IDLE]
+        all_reconnects.sort()
+        print(fmt.format("total",
+                         hours(active),
+                         hours(running),
+                         f"{100 * active / running:.1f}%" if running else "-",
+                         drops,
+                         secs(self.percentile(all_reconnects, 50)),
+                         secs(self.percentile(all_reconnects, 90)),
+                         secs(self.percentile(all_reconnects, 99))), file=out)
+
+class Metrics:
+    '''
+    Gauges and counters exported as a node_exporter textfile, rewritten
+    atomically by write() from a slow timer.
+    '''
+    FILE = Path.home() / 'var' / 'lib' / 'deskflow-applet.prom'
+
+    def __init__(self, fn=None):
+        self.fn = fn or self.FILE
+        self.values = {}
+
+    def set(self, name, value, **labels):
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def write(self):
+        lines = []
+        for (name, labels), value in sorted(self.values.items()):
+            if value is None:
+                continue
+            if labels:
+                label = ",".join(f'{k}="{v}"' for k, v in labels)
+                name = f"{name}{{{label}}}"
+            lines.append(f"{name} {value}\n")
+        self.fn.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.fn.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp, self.fn)
+        return GLib.SOURCE_CONTINUE
+
+class ResourceWatchdog:
+    '''
+    Samples CPU time, RSS and open fds of the daemon from /proc and decides
+    when it has run away.
+
+    Policies (settings, all optional):
+        watchdog_cpu_percent  restart when every sample over ...
+        watchdog_cpu_seconds  ... this many seconds is above the percentage
+        watchdog_rss_mb       restart when resident memory exceeds this
+        watchdog_fd_warn      log a warning when open fds exceed this
+    '''
+    INTERVAL = 5 # seconds
+    CPU_PERCENT = 90
+    CPU_SECONDS = 60
+    RSS_MB = 512
+    FD_WARN = 256
+
+    def __init__(self, settings, proc=Path('/proc')):
+        self.proc = proc
+        self.cpu_limit = self._number(settings, 'watchdog_cpu_percent',
+                                      self.CPU_PERCENT)
+        # the window needs at least two samples to measure a rate
+        self.cpu_seconds = max(self.INTERVAL, self._number(
+            settings, 'watchdog_cpu_seconds', self.CPU_SECONDS))
+        self.rss_limit = int(self._number(settings, 'watchdog_rss_mb',
+                                          self.RSS_MB) * (1 << 20))
+        self.fd_warn = self._number(settings, 'watchdog_fd_warn', self.FD_WARN)
+        self.clk_tck = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.samples = collections.deque(
+                maxlen=int(self.cpu_seconds // self.INTERVAL) + 1)
+        self.pid = None
+        self.fd_warned = False
+
+    @staticmethod
+    def _number(settings, name, default):
+        '''a numeric setting, or its default if it is anything else'''
+        value = settings.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            log(f"watchdog: ignoring {name} {value!r}, using {default}")
+            return default
+        return value
+
+    def reset(self, pid=None):
+        self.pid = pid
+        self.samples.clear()
+        self.fd_warned = False
+
+    def _read(self, pid):
+        base = self.proc / str(pid)
+        with open(base / 'stat', 'rb') as f:
+            # the command name may contain spaces, so split after it
+            fields = f.read().rsplit(b')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self.clk_tck
+        with open(base / 'statm', 'rb') as f:
+            rss = int(f.read().split()[1]) * self.page_size
+        fds = len(os.listdir(base / 'fd'))
+        return cpu, rss, fds
+
+    def sample(self, pid, now):
+        '''take a sample; return a reason string if the daemon should restart'''
+        if pid != self.pid:
+            self.reset(pid)
+        try:
+            cpu, rss, fds = self._read(pid)
+        except (OSError, IndexError, ValueError):
+            return None
+        self.samples.append((now, cpu, rss, fds))
+
+        if fds > self.fd_warn:
+            if not self.fd_warned:
+                log(f"watchdog: daemon ({pid}) has {fds} open fds")
+                self.fd_warned = True
+        else:
+            self.fd_warned = False
+
+        if rss > self.rss_limit:
+            return f"rss {rss >> 20} MiB over {self.rss_limit >> 20} MiB"
+        if len(self.samples) == self.samples.maxlen >= 2:
+            window = list(self.samples)
+            if all(self._percent(a, b) > self.cpu_limit
+                   for a, b in zip(window, window[1:])):
+                return (f"cpu over {self.cpu_limit}% for "
+                        f"{window[-1][0] - window[0][0]:.0f}s")
+        return None
+
+    @staticmethod
+    def _percent(a, b):
+        if b[0] <= a[0]:
+            return 0.0
+        return 100 * (b[1] - a[1]) / (b[0] - a[0])
+
+    def cpu_percent(self):
+        if len(self.samples) < 2:
+            return None
+        return self._percent(self.samples[-2], self.samples[-1])
+
+    def rss(self):
+        return self.samples[-1][2] if self.samples else None
+
+    def fds(self):
+        return self.samples[-1][3] if self.samples else None
+
+    def describe(self):
+        cpu = self.cpu_percent()
+        if cpu is None:
+            return ""
+        return f"cpu {cpu:.0f}%, rss {self.rss() >> 20} MiB, {self.fds()} fds"
+
+class LinkMonitor:
+    '''
+    Periodic TCP connect round-trip to the peer endpoint.
+
+    The connect is made with a blocking socket on a worker thread, timed
+    around connect() alone, so neither name resolution nor main-loop
+    latency counts as network RTT, and a slow or unreachable peer never
+    blocks the main loop.  A completed connect is one SYN/SYN-ACK exchange,
+    which makes its duration a fair RTT estimate.  The result is handed
+    back through GLib.idle_add.  Jitter is the RFC 3550 running estimate of
+    the variation between consecutive samples.
+    '''
+    INTERVAL = 30 # seconds
+    TIMEOUT = 5 # seconds
+    WINDOW = 20 # samples
+    DEFAULT_PORT = 24800
+    RTT_WARN_MS = 50
+    JITTER_WARN_MS = 20
+
+    def __init__(self, address, settings):
+        self.address = address
+        self.rtt_warn = settings.get('link_rtt_warn_ms', self.RTT_WARN_MS)
+        self.jitter_warn = settings.get('link_jitter_warn_ms',
+                                        self.JITTER_WARN_MS)
+        self.samples = collections.deque(maxlen=self.WINDOW)
+        self.jitter = 0.0
+        self.failed = False
+        self.failures = 0
+        self.started = None
+        self.was_degraded = None
+
+    def probe(self):
+        if self.started is None:
+            self.started = time.monotonic()
+            threading.Thread(target=self._connect, daemon=True,
+                             name='link-probe').start()
+        return GLib.SOURCE_CONTINUE
+
+    def _connect(self):
+        '''worker thread: one timed connect, reported to the main loop'''
+        try:
+            address = Gio.NetworkAddress.parse(self.address, self.DEFAULT_PORT)
+            family, kind, proto, _, sockaddr = socket.getaddrinfo(
+                    address.get_hostname(), address.get_port(),
+                    type=socket.SOCK_STREAM)[0]
+            with socket.socket(family, kind, proto) as s:
+                s.settimeout(self.TIMEOUT)
+                started = time.perf_counter()
+                s.connect(sockaddr)
+                rtt_ms = (time.perf_counter() - started) * 1000
+            result = (rtt_ms, None)
+        except (OSError, GLib.Error) as e:
+            result = (None, getattr(e, 'message', None) or str(e))
+        GLib.idle_add(profiled(self._connected), *result)
+
+    def _connected(self, rtt_ms, error):
+        self.started = None
+        if error is not None:
+            if not self.failed:
+                log(f"link: cannot reach {self.address}: {error}")
+            self.failed = True
+            self.failures += 1
+        else:
+            self.add(rtt_ms)
+        self._log_transition()
+        return GLib.SOURCE_REMOVE
+
+    def add(self, rtt_ms):
+        if self.samples:
+            self.jitter += (abs(rtt_ms - self.samples[-1]) - self.jitter) / 16
+        self.samples.append(rtt_ms)
+        self.failed = False
+
+    def percentile(self, pct):
+        return ConnectionHistory.percentile(sorted(self.samples), pct)
+
+    def degraded(self):
+        '''the reason the link is considered degraded, or None'''
+        if self.failed:
+            return f"{self.address} unreachable"
+        p95 = self.percentile(95)
+        if p95 is not None and p95 > self.rtt_warn:
+            return f"rtt p95 {p95:.1f} ms over {self.rtt_warn} ms"
+        if self.jitter > self.jitter_warn:
+            return f"jitter {self.jitter:.1f} ms over {self.jitter_warn} ms"
+        return None
+
+    def _log_transition(self):
+        degraded = self.degraded()
+        if (degraded is None) != (self.was_degraded is None):
+            log(f"link: {degraded or 'recovered'}")
+        self.was_degraded = degraded
+
+    def describe(self):
+        if not self.samples:
+            return ""
+        return (f"link p50 {self.percentile(50):.1f} ms, "
+                f"p95 {self.percentile(95):.1f} ms, "
+                f"jitter {self.jitter:.1f} ms")
+
+class LogTail:
+    '''
+    Incremental reader for the daemon log.  poll() yields only the lines
+    appended since the last call, so a tick costs the new bytes rather than
+    the whole file, read CHUNK bytes at a time so a large backlog does not
+    have to fit in memory.  The file is followed across truncation and
+    across rotation (a new inode at the same path), finishing the old file
+    first.
+    '''
+    CHUNK = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.partial = b''
+
+    def reset(self, path=None):
+        if self.f is not None:
+            self.f.close()
+        self.f = None
+        self.partial = b''
+        if path is not None:
+            self.path = path
+
+    def _read(self):
+        while True:
+            data = self.f.read(self.CHUNK)
+            if not data:
+                return
+            lines = (self.partial + data).split(b'\n')
+            self.partial = lines.pop()
+            for l in lines:
+                yield l.decode(errors='replace')
+
+    def poll(self):
+        if self.f is not None:
+            yield from self._read()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if st.st_ino != os.fstat(self.f.fileno()).st_ino:
+                self.reset()
+            elif st.st_size < self.f.tell():
+                self.f.seek(0)
+                self.partial = b''
+                yield from self._read()
+        if self.f is None:
+            try:
+                self.f = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+            yield from self._read()
+
+class LogRetention:
+    '''
+    Size-capped retention for the daemon log.
+
+    The live log is renamed aside, which is safe because the daemons reopen
+    their log file for every write, and the renamed file is gzipped into
+    <log>.<timestamp>.gz by a worker thread.  The worker keeps the newest
+    log_keep archives and reports back to the main loop through
+    GLib.idle_add, so the main loop only ever pays for a rename.  The
+    daemons' own 1 MB rotation to <log>.1 is archived the same way.
+    '''
+    MAX_MB = 4
+    KEEP = 5
+    INTERVAL = 60 # seconds between checks
+
+    def __init__(self, settings, background=True):
+        self.max_bytes = settings.get('log_max_mb', self.MAX_MB) * (1 << 20)
+        self.keep = settings.get('log_keep', self.KEEP)
+        self.background = background
+        self.jobs = queue.Queue()
+        self.worker = None
+
+    def check(self, path):
+        '''archive the daemon's own rotation, or the live log once over the cap'''
+        rotated = path.with_name(path.name + '.1')
+        if rotated.exists():
+            self.rotate(rotated, path, "rotated by the daemon")
+        else:
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                return
+            if size > self.max_bytes:
+                self.rotate(path, path, f"{size} bytes")
+
+    def rotate(self, source, path, reason):
+        '''move source aside and queue it for compression next to path'''
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        for n in itertools.count():
+            archive = path.with_name(f"{path.name}.{stamp}{'-%d' % n if n else ''}.gz")
+            staging = archive.with_suffix('')
+            if not archive.exists() and not staging.exists():
+                break
+        try:
+            if source.stat().st_size == 0:
+                source.unlink()
+                return
+            os.replace(source, staging)
+        except FileNotFoundError:
+            return
+        log(f"log rotation: {source.name} -> {archive.name} ({reason})")
+        self.jobs.put((staging, archive, path))
+        if not self.background:
+            self._work()
+        elif self.worker is None:
+            self.worker = threading.Thread(target=self._work, daemon=True,
+                                           name='log-retention')
+            self.worker.start()
+
+    def _work(self):
+        while True:
+            try:
+                staging, archive, path = self.jobs.get(block=self.background)
+            except queue.Empty:
+                return
+            try:
+                result = self._compress(staging, archive, path)
+            except OSError as e:
+                result = (archive, e)
+            if self.background:
+                GLib.idle_add(profiled(self._done), *result)
+            else:
+                self._done(*result)
+
+    def _compress(self, staging, archive, path):
+        with open(staging, 'rb') as src, gzip.open(archive, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        outcome = f"{staging.stat().st_size} -> {archive.stat().st_size} bytes"
+        staging.unlink()
+        archives = self.archives(path)
+        for old in archives[:-self.keep] if self.keep > 0 else archives:
+            old.unlink(missing_ok=True)
+        return (archive, outcome)
+
+    def _done(self, archive, outcome):
+        if isinstance(outcome, Exception):
+            log(f"log rotation: cannot compress {archive.name}: {outcome}")
+        else:
+            log(f"log rotation: archived {archive.name}, {outcome}")
+        return GLib.SOURCE_REMOVE
+
+    @staticmethod
+    def archives(path):
+        '''the compressed generations of path, oldest first'''
+        return sorted(path.parent.glob(path.name + '.*.gz'),
+                      key=lambda p: p.stat().st_mtime_ns)
+
+class ClientTracker:
+    '''
+    Which remote screens are connected to the server, keyed by screen name
+    and updated in O(1) per connect/disconnect line from the daemon log.
+    '''
+    EVENT = re.compile(r'client "([^"]+)" (?:has )?(connected|disconnected)')
+
+    def __init__(self):
+        self.clients = {}
+        self.connected = set()
+        self.version = 0
+
+    def reset(self):
+        '''the daemon restarted: everybody is gone, history stays'''
+        for client in self.clients.values():
+            client['since'] = None
+        self.connected.clear()
+        self.version += 1
+
+    def seen(self):
+        return bool(self.clients)
+
+    def update(self, line, now):
+        '''apply a log line; returns whether it was a client event'''
+        m = self.EVENT.search(line)
+        if m is None:
+            return False
+        name, event = m.groups()
+        client = self.clients.setdefault(name, {'since': None, 'drops': 0})
+        if event == 'connected':
+            if name not in self.connected:
+                self.connected.add(name)
+                client['since'] = now
+                self.version += 1
+        elif name in self.connected:
+            self.connected.discard(name)
+            client['since'] = None
+            client['drops'] += 1
+            self.version += 1
+        return True
+
+    def describe(self, name):
+        client = self.clients[name]
+        drops = f", {client['drops']} drops" if client['drops'] else ""
+        if client['since'] is None:
+            return f"{name}: disconnected{drops}"
+        since = datetime.fromtimestamp(client['since']).strftime("%H:%M:%S")
+        return f"{name}: connected since {since}{drops}"
+
+    def summary(self):
+        return f"{len(self.connected)}/{len(self.clients)} clients connected"
+
+class ConfigFile:
+    '''
+    A daemon config file, identified by a hash of its effective content:
+    comments (whole-line and trailing), blank lines, whitespace runs and
+    the spacing around '=', ':' and ',' are dropped before hashing, so
+    cosmetic edits and identical rewrites hash the same.  In ini files a
+    trailing comment must follow whitespace, as with configparser, so that
+    values such as colours keep their '#'.
+    '''
+    LAYOUT = 'layout' # section: ... end server layout, reloadable
+    SETTINGS = 'settings' # ini style, needs a restart
+    COMMENT = re.compile(r'^\s*[#;]')
+    TRAILING_COMMENT = {
+        LAYOUT: re.compile(r'#.*'),
+        SETTINGS: re.compile(r'\s[#;].*'),
+    }
+    PUNCTUATION = re.compile(r'\s*([=:,])\s*')
+    SECTIONS = ('screens', 'links', 'aliases', 'options')
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+
+    def lines(self):
+        with open(self.path, 'r', errors='replace') as f:
+            for line in f:
+                if self.COMMENT.match(line):
+                    continue
+                line = self.TRAILING_COMMENT[self.kind].sub('', line)
+                line = self.PUNCTUATION.sub(r'\1', ' '.join(line.split()))
+                if line:
+                    yield line
+
+    def digest(self):
+        h = hashlib.sha256()
+        try:
+            for line in self.lines():
+                h.update(line.encode())
+                h.update(b'\n')
+        except OSError:
+            return None
+        return h.hexdigest()
+
+    def validate(self):
+        '''None if the file looks usable by the daemon, else the problem'''
+        try:
+            lines = list(self.lines())
+        except OSError as e:
+            return str(e)
+        if self.kind == self.SETTINGS:
+            for line in lines:
+                if line.startswith('[') and not line.endswith(']'):
+                    return f"malformed section header {line}"
+            parser = configparser.ConfigParser(strict=False, interpolation=None,
+                                               allow_no_value=True)
+            try:
+                parser.read_string("[top]\n" + "\n".join(lines))
+            except configparser.Error as e:
+                return str(e).splitlines()[0]
+            return None
+        section = None
+        seen = set()
+        for n, line in enumerate(lines, 1):
+            if line.startswith('section:'):
+                if section is not None:
+                    return f"section {section} is missing 'end'"
+                section = line.split(':', 1)[1].strip()
+                if section not in self.SECTIONS:
+                    return f"unknown section {section}"
+                seen.add(section)
+            elif line == 'end':
+                if section is None:
+                    return "'end' outside of a section"
+                section = None
+            elif section is None:
+                return f"'{line}' outside of a section"
+        if section is not None:
+            return f"section {section} is missing 'end'"
+        if 'screens' not in seen:
+            return "no screens section"
+        return None
+
+class ConfigManager:
+    '''
+    Watches the daemon's config files and reports only changes to their
+    effective content, after the new content has been validated.
+    '''
+    DEBOUNCE_MS = 500
+
+    def __init__(self, loop, on_change):
+        self.loop = loop
+        self.on_change = on_change
+        self.files = []
+        self.digests = {}
+        self.monitors = []
+        self.check_id = None
+
+    def watch(self, files):
+        for monitor in self.monitors:
+            monitor.cancel()
+        self.monitors = []
+        self.files = files
+        self.digests = {cf.path: cf.digest() for cf in files}
+        for cf in files:
+            monitor = Gio.File.new_for_path(str(cf.path)).monitor_file(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect('changed', profiled(self._changed))
+            self.monitors.append(monitor)
+
+    def _changed(self, monitor, f, other, event):
+        # editors and tools write in bursts; look once they settle
+        if self.check_id is not None:
+            self.loop.source_remove(self.check_id)
+        self.check_id = self.loop.timeout_add(self.DEBOUNCE_MS, self.check)
+
+    def check(self):
+        self.check_id = None
+        changed = [cf for cf in self.files
+                   if cf.digest() != self.digests.get(cf.path)]
+        if not changed:
+            return GLib.SOURCE_REMOVE
+        for cf in changed:
+            problem = cf.validate()
+            if problem is not None:
+                log(f"config: {cf.path} is invalid, keeping the running "
+                    f"daemon: {problem}")
+                return GLib.SOURCE_REMOVE
+        for cf in changed:
+            log(f"config: {cf.path} changed")
+            self.digests[cf.path] = cf.digest()
+        self.on_change(changed)
+        return GLib.SOURCE_REMOVE
+
+class Scheduling:
+    '''
+    Scheduling applied to the daemon by the applet as soon as it is spawned.
+
+    Configured per mode in the spawn_options setting, for example
+        "spawn_options": {
+            "client": {
+                "nice": -5,
+                "ioprio": "best-effort:0",
+                "cpu_affinity": [2, 3],
+                "cgroup": {"path": "deskflow", "cpu.weight": 1000,
+                           "memory.max": "256M"}
+            }
+        }
+    A relative cgroup path is created next to the applet's own cgroup v2
+    directory.  Everything is applied from the applet by pid, not in a
+    preexec_fn, which is unsafe now that the applet runs threads.  Anything
+    the applet is not permitted to do is logged and skipped; use report()
+    to see what actually took effect.
+    '''
+    IOPRIO_CLASSES = ('none', 'realtime', 'best-effort', 'idle')
+    IOPRIO_CLASS_SHIFT = 13
+    IOPRIO_WHO_PROCESS = 1
+    # (ioprio_set, ioprio_get)
+    IOPRIO_SYSCALLS = {
+        'x86_64': (251, 252),
+        'i686': (289, 290),
+        'aarch64': (30, 31),
+        'armv7l': (314, 315),
+    }
+    CGROUP_ROOT = Path('/sys/fs/cgroup')
+
+    def __init__(self, options):
+        self.nice = self._nice(options.get('nice'))
+        self.ioprio = self._ioprio(options.get('ioprio'))
+        self.cpus = self._cpus(options.get('cpu_affinity'))
+        self.cgroup = self._cgroup(options.get('cgroup'))
+        self.cgroup_dir = None
+        self.syscalls = self.IOPRIO_SYSCALLS.get(platform.machine())
+        self.libc = ctypes.CDLL(None, use_errno=True)
+
+    @staticmethod
+    def _nice(value):
+        if value is None:
+            return None
+        if (isinstance(value, bool) or not isinstance(value, int)
+                or not -20 <= value <= 19):
+            log(f"scheduling: ignoring nice {value!r}: not an integer -20-19")
+            return None
+        return value
+
+    @staticmethod
+    def _cpus(value):
+        if value is None:
+            return None
+        if not isinstance(value, list) or not value or not all(
+                isinstance(cpu, int) and not isinstance(cpu, bool) and cpu >= 0
+                for cpu in value):
+            log(f"scheduling: ignoring cpu_affinity {value!r}: "
+                "not a list of cpu numbers")
+            return None
+        return value
+
+    @staticmethod
+    def _cgroup(value):
+        if value is None or isinstance(value, dict):
+            return value
+        log(f"scheduling: ignoring cgroup {value!r}: not an object")
+        return None
+
+    def _ioprio(self, value):
+        if value is None:
+            return None
+        cls, _, level = str(value).partition(':')
+        try:
+            if cls not in self.IOPRIO_CLASSES:
+                raise ValueError("class is not one of "
+                                 + ", ".join(self.IOPRIO_CLASSES))
+            level = int(level or 0)
+            if not 0 <= level <= 7:
+                raise ValueError("level is not 0-7")
+        except ValueError as e:
+            log(f"scheduling: ignoring ioprio {value!r}: {e}")
+            return None
+        return (self.IOPRIO_CLASSES.index(cls) << self.IOPRIO_CLASS_SHIFT) | level
+
+    def _cgroup_parent(self):
+        if not (self.CGROUP_ROOT / 'cgroup.controllers').exists():
+            return None
+        with open('/proc/self/cgroup') as f:
+            for line in f:
+                if line.startswith('0::'):
+                    return self.CGROUP_ROOT / line[3:].strip().lstrip('/')
+        return None
+
+    def prepare(self):
+        '''create and configure the cgroup; runs in the applet'''
+        self.cgroup_dir = None
+        if not self.cgroup:
+            return
+        path = Path(self.cgroup.get('path', 'deskflow'))
+        if not path.is_absolute():
+            parent = self._cgroup_parent()
+            if parent is None:
+                log("scheduling: no cgroup v2 hierarchy, skipping cgroup")
+                return
+            # processes cannot live in an inner cgroup, so go next to ours
+            if parent != self.CGROUP_ROOT:
+                parent = parent.parent
+            path = parent / path
+        try:
+            path.mkdir(exist_ok=True)
+            for key, value in self.cgroup.items():
+                if key != 'path':
+                    (path / key).write_text(f"{value}\n")
+        except OSError as e:
+            log(f"scheduling: cannot use cgroup {path}: {e}")
+            return
+        if os.access(path / 'cgroup.procs', os.W_OK):
+            self.cgroup_dir = path
+
+    def apply(self, pid):
+        '''apply to every thread of a freshly spawned daemon'''
+        if self.cgroup_dir is not None:
+            try:
+                (self.cgroup_dir / 'cgroup.procs').write_text(f"{pid}\n")
+            except OSError as e:
+                log(f"scheduling: cannot move {pid} to {self.cgroup_dir}: {e}")
+        try:
+            tids = [int(t) for t in os.listdir(f'/proc/{pid}/task')]
+        except OSError:
+            tids = [pid]
+        failed = set()
+        for tid in tids:
+            if self.nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                except OSError as e:
+                    failed.add(f"nice {self.nice}: {e.strerror}")
+            if self.ioprio is not None and self.syscalls is not None:
+                if self.libc.syscall(self.syscalls[0], self.IOPRIO_WHO_PROCESS,
+                                     tid, self.ioprio) < 0:
+                    failed.add(f"ioprio: {os.strerror(ctypes.get_errno())}")
+            if self.cpus:
+                try:
+                    os.sched_setaffinity(tid, self.cpus)
+                except OSError as e:
+                    failed.add(f"cpu_affinity {self.cpus}: {e.strerror}")
+        for reason in sorted(failed):
+            log(f"scheduling: {pid}: {reason}")
+
+    def report(self, pid):
+        '''the effective settings of a running process'''
+        effective = {}
+        try:
+            effective['nice'] = os.getpriority(os.PRIO_PROCESS, pid)
+            effective['cpus'] = sorted(os.sched_getaffinity(pid))
+            with open(f'/proc/{pid}/cgroup') as f:
+                for line in f:
+                    if line.startswith('0::'):
+                        effective['cgroup'] = line[3:].strip()
+        except OSError:
+            pass
+        if self.syscalls is not None:
+            value = self.libc.syscall(self.syscalls[1],
+                                      self.IOPRIO_WHO_PROCESS, pid)
+            if value >= 0:
+                cls = self.IOPRIO_CLASSES[value >> self.IOPRIO_CLASS_SHIFT]
+                level = value & ((1 << self.IOPRIO_CLASS_SHIFT) - 1)
+                effective['ioprio'] = f"{cls}:{level}"
+        return effective
+
 class DeskFlow:
     SETTINGS_FILE = Path.home() / '.config' / 'Deskflow' / 'deskflow-applet.conf'
     SETTINGS_DEFAULTS={ "mode": "client", "follow_screensaver": False }
+    LOG_DIR = Path.home() / 'var' / 'log'
+    CONFIG_DIR = Path.home() / '.config' / 'Deskflow'
+    # read by the helpers on the other machine to pick the opposite mode
+    MODE_FILE = Path.home() / 'var' / 'run' / 'barrier-mode'
     INACTIVE = 0
     ACTIVE = 1
     IDLE = 2
@@ -139,60 +1640,124 @@ class DeskFlow:
         log("deskflow(mode={})".format(server_mode))
         log("deskflow.settings = {}".format(self.settings.values()))
         if server_mode is not None:
-            self.settings.mode = server_mode
-        else:
-            self.server_mode = self.settings.mode == "server"
+            self.settings.mode = "server" if server_mode else "client"
         self.p = None
+        self.effective_scheduling = {}
+        self.clients = ClientTracker()
+        self.retention = self.create_retention()
+        self.configure_mode()
+        self.publish_mode()
+
+    def configure_mode(self):
+        self.server_mode = self.settings.mode == "server"
         self.log_filter = re.compile(r'(IPC: .*connected)')
+        self.ready_filter = re.compile(r'started server|connecting to')
         if self.server_mode:
-            self.log_file = Path.home() / 'var' / 'log' / 'deskflow-server.log'
+            self.log_file = self.LOG_DIR / 'deskflow-server.log'
         else:
-            self.log_file = Path.home() / 'var' / 'log' / 'deskflow-client.log'
+            self.log_file = self.LOG_DIR / 'deskflow-client.log'
+        self.tail = LogTail(self.log_file)
+        self.last_event = None
+
+    def set_mode(self, server_mode):
+        '''switch modes in place; the daemon must already be stopped'''
+        self.settings.mode = "server" if server_mode else "client"
+        self.configure_mode()
+        self.publish_mode()
+
+    def publish_mode(self):
+        try:
+            self.MODE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            self.MODE_FILE.write_text(f"{self.settings.mode}\n")
+        except OSError as e:
+            log(f"cannot publish mode to {self.MODE_FILE}: {e}")
 
     def __del__(self):
         self.stop()
 
     def unlock_remote(self, *args, **kwargs):
-        cmd = self.settings.remote_unlock_command
+        cmd = self.settings.get('remote_unlock_command')
         if cmd is None:
             return
         log(f"unlocking remote because of local screen unlock: {cmd}")
-        self.p = subprocess.Popen([cmd],
+        # not self.p, that is the daemon
+        self.unlock_p = self.spawn([cmd])
+
+    def create_retention(self):
+        return LogRetention(self.settings)
+
+    def spawn(self, argv, sched=None):
+        if sched is not None:
+            sched.prepare()
+        p = subprocess.Popen(argv,
             stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL)
+        if sched is not None:
+            sched.apply(p.pid)
+        return p
+
+    def peer_address(self):
+        # the client's server address lives in deskflow-client.conf
+        return self.settings.get('peer_address')
+
+    def config_files(self):
+        if self.server_mode:
+            return [
+                ConfigFile(self.CONFIG_DIR / 'Deskflow.conf', ConfigFile.SETTINGS),
+                ConfigFile(self.CONFIG_DIR / 'deskflow-server.conf',
+                           ConfigFile.LAYOUT),
+            ]
+        return [ConfigFile(self.CONFIG_DIR / 'deskflow-client.conf',
+                           ConfigFile.SETTINGS)]
+
+    def reload(self):
+        '''ask a running server to re-read its layout'''
+        if not self.running():
+            return False
+        log(f"reloading deskflow configuration ({self.p.pid})")
+        self.p.send_signal(signal.SIGHUP)
+        return True
+
+    def scheduling(self):
+        options = self.settings.get('spawn_options', {}).get(self.settings.mode)
+        if not options:
+            return None
+        return Scheduling(options)
 
     def start(self):
         if not self.running():
             self.log_file.parent.mkdir(parents=True, exist_ok=True)
-            self.log_file.unlink(missing_ok=True)
+            # keep the previous run's log for post-mortems
+            self.retention.rotate(self.log_file, self.log_file, "restart")
+            self.tail.reset()
+            self.last_event = None
+            self.clients.reset()
             log("launching deskflow ({} mode) ...".format(self.settings.mode))
+            sched = self.scheduling()
             if self.server_mode:
                 pname = '/usr/bin/deskflow-server'
                 log("checking for other deskflow-server")
                 self.kill_others(pname)
                 log("starting new deskflow-server")
-                self.p = subprocess.Popen(
+                self.p = self.spawn(
                         [
-                            pname, '-s', str(Path.home() / '.config' /
-                                             'Deskflow' / 'Deskflow.conf'),
-                            '-c', str(Path.home() / '.config' / 'Deskflow' /
-                                      'deskflow-server.conf')
-                         ],
-                        stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL)
+                            pname, '-s', str(self.CONFIG_DIR / 'Deskflow.conf'),
+                            '-c', str(self.CONFIG_DIR / 'deskflow-server.conf')
+                         ], sched)
                 log(f"started new deskflow-server: {self.p.pid}")
             else:
                 pname = '/usr/bin/deskflow-client'
                 self.kill_others(pname)
-                self.p = subprocess.Popen(
+                self.p = self.spawn(
                         [
-                            pname, '-s', str(Path.home() / '.config' /
-                                             'Deskflow' / 'deskflow-client.conf')
-                        ],
-                        stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL)
+                            pname, '-s', str(self.CONFIG_DIR / 'deskflow-client.conf')
+                        ], sched)
             if not self.p:
                 raise ExecutionError('Failed to start deskflow')
+            self.effective_scheduling = {}
+            if sched is not None:
+                self.effective_scheduling = sched.report(self.p.pid)
+                log(f"deskflow scheduling: {self.effective_scheduling}")
 
     def kill_others(self, others):
          for line in os.popen("ps ax | grep " + others + " | grep -v grep"):
@@ -224,42 +1789,80 @@ class DeskFlow:
         log(f"deskflow alive: {r}{pid}{msg}")
         return r
 
-    def has_connection(self):
-        lines = []
+    def is_ready(self):
+        '''whether the daemon has logged that it is listening/connecting'''
         try:
             with self.log_file.open() as f:
-                lines = f.readlines() 
-        except:
-            pass
-        lines = list(filter(lambda l: self.log_filter.search(l), lines))
-        if len(lines) > 0:
-            #[2025-12-16T13:06:38.629] WARNING: failed to connect to server: Connection refused
-            if 'disconnected' in lines[-1]:
-                return False
-            return True
-        return False
+                return any(self.ready_filter.search(l) for l in f)
+        except OSError:
+            return False
+
+    def has_connection(self, now=None):
+        now = time.time() if now is None else now
+        for line in self.tail.poll():
+            if self.clients.update(line, now):
+                continue
+            if self.log_filter.search(line):
+                self.last_event = line
+        if self.server_mode and self.clients.seen():
+            return bool(self.clients.connected)
+        #[2025-12-16T13:06:38.629] WARNING: failed to connect to server: Connection refused
+        return self.last_event is not None and 'disconnected' not in self.last_event
+
+    def connection_line(self, connected, client='peer'):
+        '''the line logged when the peer, or a named client, comes or goes'''
+        if self.server_mode:
+            return 'NOTE: client "{}" has {}connected'.format(
+                    client, '' if connected else 'dis')
+        return 'IPC: client {}connected'.format('' if connected else 'dis')
 
 def appdir():
     return os.path.dirname(os.path.realpath(__file__))
 
-class InputLeapApplication(Gtk.Application):
+class InputLeapApplication(Gtk.Application if Gtk else object):
     IDLE_TIMEOUT = 10 # seconds
-
-    def __init__(self):
+    SWITCH_BUDGET = 1.0 # seconds from click to listening
+    SWITCH_TIMEOUT = 10 # seconds
+    SWITCH_POLL_MS = 50
+    WAKE_NETWORK_TIMEOUT = 30 # seconds
+    WAKE_POLL_MS = 250
+
+    def __init__(self, loop=None, profile=False):
+        self.loop = loop or MainLoop()
         # mechanism to capture timeout_source ID
         self.delay_id = None
-
-        self.indicator = AppIndicator3.Indicator.new(
-            'deskflow-Control',
-            'deskflow-messages',
-            AppIndicator3.IndicatorCategory.APPLICATION_STATUS,
-        )
-        self.indicator.set_icon_theme_path(f"{appdir()}/media")
-        self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
-
-        self.bus = dbus.SessionBus()
-        self.deskflow = DeskFlow()
-        self.saver = ScreensaverStatus(self.bus)
+        self.switch_id = None
+        self.menu_clients = None
+        self.clients_version = None
+        self.sleeping = False
+        self.wake_id = None
+        self.wake_started = None
+        self.wake_restart = False
+        self.reconnect = None
+        self.user_idle = False
+        self.idle_paused = False
+        self.wake_probe = False
+        self.wake_reachable = False
+
+        self.indicator = self.create_indicator()
+        self.bus = self.create_bus()
+        self.system_bus = self.create_system_bus()
+        self.deskflow = self.create_daemon()
+        self.profiler = None
+        if profile or self.deskflow.settings.get('profile_callbacks'):
+            self.profiler = Profiler(
+                    self.deskflow.settings.get('profile_slow_ms'),
+                    self.deskflow.settings.get('profile_stall_ms')).install()
+        self.history = self.create_history()
+        self.history.compact(self.loop.time())
+        self.history.recover()
+        self.metrics = self.create_metrics()
+        self.watchdog = self.create_watchdog()
+        self.link = self.create_link_monitor()
+        self.config = self.create_config_manager()
+        if self.config is not None:
+            self.config.watch(self.deskflow.config_files())
+        self.saver = self.create_saver()
         if self.deskflow.server_mode:
             self.saver.unlock_callback(self.on_unlock_screen)
         else:
@@ -269,14 +1872,107 @@ class InputLeapApplication(Gtk.Application):
         self.saver.lock_callback(self.on_lock_screen)
 
         self.screensaver_inhibitor = None
+        self.sleep_monitor = self.create_sleep_monitor()
+        self.idle_release = self.deskflow.settings.get('idle_release_seconds',
+                                                       ScreensaverStatus.IDLE)
+        self.idle_pause = self.deskflow.settings.get('idle_pause_seconds')
+        self.idle_monitor = self.create_idle_monitor()
 
-        if self.follow_screensaver and self.saver.is_locked():
-            self.stop()
+        if self.follow_screensaver:
+            # the lock state is read asynchronously
+            self.saver.ready_callback(self.initial_state)
         else:
             self.start()
 
         self.set_icon(self.inhibited_icon())
 
+        self.create_menu()
+
+        self.loop.timeout_add_seconds(30, self.collect_garbage)
+        self.loop.timeout_add_seconds(60, self.history_timer)
+        self.loop.timeout_add_seconds(1, self.status_timer)
+        self.loop.timeout_add_seconds(ResourceWatchdog.INTERVAL,
+                                      self.watchdog_timer)
+        self.loop.timeout_add_seconds(15, self.metrics.write)
+        self.loop.timeout_add_seconds(LogRetention.INTERVAL,
+                                      self.retention_timer)
+        if self.link is not None:
+            self.link.probe()
+        # always armed, since a mode switch can bring a peer into play
+        self.loop.timeout_add_seconds(LinkMonitor.INTERVAL, self.link_timer)
+
+    def create_indicator(self):
+        indicator = AppIndicator3.Indicator.new(
+            'deskflow-Control',
+            'deskflow-messages',
+            AppIndicator3.IndicatorCategory.APPLICATION_STATUS,
+        )
+        indicator.set_icon_theme_path(f"{appdir()}/media")
+        indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
+        return indicator
+
+    def create_bus(self):
+        return dbus.SessionBus()
+
+    def create_daemon(self):
+        return DeskFlow()
+
+    def create_history(self):
+        return ConnectionHistory(
+            retention_days=self.deskflow.settings.get('history_retention_days'))
+
+    def create_metrics(self):
+        return Metrics()
+
+    def create_watchdog(self):
+        return ResourceWatchdog(self.deskflow.settings)
+
+    def create_link_monitor(self):
+        address = self.deskflow.peer_address()
+        if address is None:
+            return None
+        return LinkMonitor(address, self.deskflow.settings)
+
+    def create_config_manager(self):
+        return ConfigManager(self.loop, self.config_changed)
+
+    def create_system_bus(self):
+        try:
+            return dbus.SystemBus()
+        except dbus.DBusException as e:
+            log(f"no system bus: {e}")
+            return None
+
+    def create_saver(self):
+        return ScreensaverStatus(
+                self.bus, self.system_bus,
+                self.deskflow.settings.get('screensaver_provider', 'auto'),
+                self.loop.monotonic)
+
+    def create_inhibitor(self):
+        return ScreensaverInhibit(self.bus)
+
+    def create_sleep_monitor(self):
+        if self.system_bus is None:
+            return None
+        try:
+            return SleepMonitor(self.system_bus, self.on_sleep, self.on_wake)
+        except dbus.DBusException as e:
+            log(f"not following suspend/resume: {e}")
+            return None
+
+    def create_idle_monitor(self):
+        thresholds = [t for t in (self.idle_release, self.idle_pause) if t]
+        if not thresholds:
+            return None
+        try:
+            return IdleMonitor(self.bus, self.system_bus, thresholds,
+                               self.on_idle, self.on_active)
+        except dbus.DBusException as e:
+            log(f"not following session idle time: {e}")
+            return None
+
+    def create_menu(self):
         self.menu = Gtk.Menu()
         self.indicator.set_menu(self.menu)
 
@@ -287,6 +1983,7 @@ class InputLeapApplication(Gtk.Application):
         self.menu_client_mode = Gtk.RadioMenuItem(
                 label='Client Mode', active=not self.deskflow.server_mode,
                 group=self.menu_server_mode)
+        self.menu_clients = Gtk.MenuItem(label='Clients')
         self.menu_delay_1s = Gtk.MenuItem(label='Restart')
         self.menu_delay_10s = Gtk.MenuItem(label='10 Seconds')
         self.menu_delay_60s = Gtk.MenuItem(label='1 Minute')
@@ -299,18 +1996,20 @@ class InputLeapApplication(Gtk.Application):
         self.menu_service_toggle = Gtk.MenuItem(label='Toggle')
         self.menu_quit = Gtk.MenuItem(label='Exit')
 
-        self.menu_follow_screensaver.connect('activate', self.set_follow)
-        self.menu_delay_1s.connect('activate', self.delay_handler, 1)
-        self.menu_delay_10s.connect('activate', self.delay_handler, 10)
-        self.menu_delay_60s.connect('activate', self.delay_handler, 60)
-        self.menu_delay_30m.connect('activate', self.delay_handler, 30 * 60)
-        self.menu_delay_60m.connect('activate', self.delay_handler, 60 * 60)
-        self.menu_delay_90m.connect('activate', self.delay_handler, 90 * 60)
-        self.menu_delay_120m.connect('activate', self.delay_handler, 120 * 60)
-        self.menu_service_start.connect('activate', self.service_start_handler)
-        self.menu_service_stop.connect('activate', self.service_stop_handler)
-        self.menu_service_toggle.connect('activate', self.service_toggle_handler)
-        self.menu_quit.connect('activate', self.quit_handler)
+        self.menu_follow_screensaver.connect('activate', profiled(self.set_follow))
+        self.menu_server_mode.connect('toggled', profiled(self.set_mode))
+        self.menu_client_mode.connect('toggled', profiled(self.set_mode))
+        self.menu_delay_1s.connect('activate', profiled(self.delay_handler), 1)
+        self.menu_delay_10s.connect('activate', profiled(self.delay_handler), 10)
+        self.menu_delay_60s.connect('activate', profiled(self.delay_handler), 60)
+        self.menu_delay_30m.connect('activate', profiled(self.delay_handler), 30 * 60)
+        self.menu_delay_60m.connect('activate', profiled(self.delay_handler), 60 * 60)
+        self.menu_delay_90m.connect('activate', profiled(self.delay_handler), 90 * 60)
+        self.menu_delay_120m.connect('activate', profiled(self.delay_handler), 120 * 60)
+        self.menu_service_start.connect('activate', profiled(self.service_start_handler))
+        self.menu_service_stop.connect('activate', profiled(self.service_stop_handler))
+        self.menu_service_toggle.connect('activate', profiled(self.service_toggle_handler))
+        self.menu_quit.connect('activate', profiled(self.quit_handler))
 
         # toggle on / off on middle click
         self.indicator.set_secondary_activate_target(self.menu_service_toggle)
@@ -318,6 +2017,7 @@ class InputLeapApplication(Gtk.Application):
         self.menu.append(self.menu_follow_screensaver)
         self.menu.append(self.menu_server_mode)
         self.menu.append(self.menu_client_mode)
+        self.menu.append(self.menu_clients)
         self.menu.append(Gtk.SeparatorMenuItem())
         self.menu.append(self.menu_delay_1s)
         self.menu.append(self.menu_delay_10s)
@@ -332,14 +2032,19 @@ class InputLeapApplication(Gtk.Application):
         self.menu.append(Gtk.SeparatorMenuItem())
         self.menu.append(self.menu_quit)
 
-        GLib.timeout_add_seconds(30, self.collect_garbage)
-        GLib.timeout_add_seconds(1, self.status_timer)
-
         self.menu.show_all()
+        self.clients_changed()
 
     def __del__(self):
         self.deskflow.stop()
 
+    def initial_state(self):
+        if self.saver.is_locked():
+            log("follow_screensaver: screen locked at startup")
+            self.stop()
+        else:
+            self.start()
+
     def on_lock_screen(self):
         if self.follow_screensaver:
             log("follow_screensaver: stopping deskflow on screen lock")
@@ -351,6 +2056,117 @@ class InputLeapApplication(Gtk.Application):
             log("follow_screensaver: restarting deskflow on screen unlock")
             self.start()
 
+    def on_sleep(self):
+        self.sleeping = True
+        self.reconnect = None
+        self.cancel_wake()
+        self.wake_restart = self.deskflow.running()
+        self.metrics.inc('applet_sleeps_total')
+        if self.wake_restart:
+            log("stopping deskflow before sleep")
+            self.stop()
+
+    def on_wake(self):
+        self.wake_started = self.loop.monotonic()
+        self.await_connection('wake', 'applet_wake_to_connected_seconds')
+        self.wake_reachable = False
+        self.cancel_wake()
+        self.wake_id = self.loop.timeout_add(self.WAKE_POLL_MS, self.wake_ready)
+
+    def wake_ready(self):
+        elapsed = self.loop.monotonic() - self.wake_started
+        online = self.network_available()
+        if not online and elapsed < self.WAKE_NETWORK_TIMEOUT:
+            return GLib.SOURCE_CONTINUE
+        self.wake_id = None
+        self.sleeping = False
+        log("woke up: network {} after {:.3f}s".format(
+            "reachable" if online else "still unreachable", elapsed))
+        if not self.wake_restart or (self.follow_screensaver
+                                     and self.saver.is_locked()):
+            # nothing to resume, or the unlock will do it
+            self.reconnect = None
+            return GLib.SOURCE_REMOVE
+        log("restarting deskflow after sleep")
+        self.start()
+        return GLib.SOURCE_REMOVE
+
+    def cancel_wake(self):
+        if self.wake_id is not None:
+            self.loop.source_remove(self.wake_id)
+            self.wake_id = None
+
+    def network_available(self):
+        '''whether the peer, or failing that any network, looks reachable'''
+        monitor = Gio.NetworkMonitor.get_default()
+        if not monitor.get_network_available():
+            return False
+        address = self.deskflow.peer_address()
+        if address is None:
+            return True
+        if not self.wake_probe:
+            self.wake_probe = True
+            monitor.can_reach_async(
+                    Gio.NetworkAddress.parse(address, LinkMonitor.DEFAULT_PORT),
+                    None, profiled(self._wake_reached), None)
+        return self.wake_reachable
+
+    def _wake_reached(self, monitor, result, data):
+        self.wake_probe = False
+        try:
+            self.wake_reachable = monitor.can_reach_finish(result)
+        except GLib.Error:
+            self.wake_reachable = False
+
+    def on_idle(self, seconds):
+        if self.sleeping:
+            return
+        if seconds == self.idle_release:
+            self.user_idle = True
+            if self.screensaver_inhibitor is not None:
+                log(f"idle for {seconds}s: releasing the screensaver inhibit")
+                self.screensaver_inhibitor = None
+        # only a client pauses: a server would drop every attached screen
+        if (seconds == self.idle_pause and not self.deskflow.server_mode
+                and self.deskflow.running()):
+            log(f"idle for {seconds}s: pausing deskflow")
+            self.stop_delay_timer()
+            self.stop()
+            self.idle_paused = True
+
+    def on_active(self):
+        self.user_idle = False
+        if self.idle_paused:
+            self.idle_paused = False
+            if self.sleeping or (self.follow_screensaver
+                                 and self.saver.is_locked()):
+                return
+            log("user active: resuming deskflow")
+            self.await_connection('activity', 'applet_idle_resume_seconds',
+                                  self.IDLE_TIMEOUT)
+            self.start()
+        elif (not self.deskflow.server_mode
+              and self.deskflow.current_icon == self.deskflow.ACTIVE
+              and self.screensaver_inhibitor is None):
+            log("user active: inhibiting the screensaver again")
+            self.screensaver_inhibitor = self.create_inhibitor()
+
+    def await_connection(self, event, metric, timeout=None):
+        '''time how long it takes the daemon to connect after event'''
+        self.reconnect = (event, metric, self.loop.monotonic(), timeout)
+
+    def check_reconnect(self, connected):
+        event, metric, started, timeout = self.reconnect
+        elapsed = self.loop.monotonic() - started
+        if connected:
+            log(f"connected {elapsed:.3f}s after {event}")
+            self.metrics.set(metric, round(elapsed, 3))
+        elif timeout is None or elapsed < timeout:
+            return
+        else:
+            log(f"not connected {timeout}s after {event}")
+        self.reconnect = None
+
     def restart_daemon(self, *args, **kwargs):
         log("restarting because of screen unlock")
         self.delay_handler(None, 1)
@@ -359,7 +2175,7 @@ class InputLeapApplication(Gtk.Application):
         log(f"delay_handler({timeout})")
         self.stop()
         self.stop_delay_timer()
-        self.delay_id = GLib.timeout_add_seconds(timeout, self.delayed_start)
+        self.delay_id = self.loop.timeout_add_seconds(timeout, self.delayed_start)
 
     def delayed_start(self):
         log("delayed_start")
@@ -372,8 +2188,9 @@ class InputLeapApplication(Gtk.Application):
             self.deskflow.current_icon = self.deskflow.ACTIVE
             return ('deskflow-active', 'deskflow Server Active')
         else:
-            if self.deskflow.current_icon != self.deskflow.ACTIVE:
-                self.screensaver_inhibitor = ScreensaverInhibit(self.bus)
+            if (self.deskflow.current_icon != self.deskflow.ACTIVE
+                    and not self.user_idle):
+                self.screensaver_inhibitor = self.create_inhibitor()
             self.deskflow.current_icon = self.deskflow.ACTIVE
             return ('deskflow-active', 'deskflow Client Active')
 
@@ -398,22 +2215,75 @@ class InputLeapApplication(Gtk.Application):
         self.follow_screensaver = not self.follow_screensaver
         self.deskflow.settings.follow_screensaver = self.follow_screensaver
 
-    def set_mode(self, *args, **kwargs):
+    def set_mode(self, widget, *args, **kwargs):
+        # both radio items fire 'toggled'; act on the one that became active
+        if widget.get_active():
+            self.switch_mode(widget is self.menu_server_mode)
+
+    def switch_mode(self, server_mode):
+        if server_mode == self.deskflow.server_mode:
+            return
+        started = self.loop.monotonic()
         restart = self.deskflow.running()
-        if mode == 1:
-            if not self.deskflow.server_mode:
-                self.stop()
-                log("Server Mode")
-                self.deskflow = DeskFlow(True)
-                if restart:
-                    self.start()
+        self.stop_delay_timer()
+        self.stop()
+        self.deskflow.set_mode(server_mode)
+        log("switching to {} mode".format(self.deskflow.settings.mode))
+        if self.config is not None:
+            self.config.watch(self.deskflow.config_files())
+        self.retarget_link()
+        if server_mode:
+            self.saver.unlock_callback(self.on_unlock_screen)
         else:
-            if self.deskflow.server_mode:
-                self.stop()
-                log("Client mode!")
-                self.deskflow = DeskFlow(False)
-                if restart:
-                    self.start()
+            self.saver.unlock_callback(self.restart_daemon)
+        if not restart:
+            self.switch_done(started, False)
+            return
+        self.start()
+        if self.switch_id is not None:
+            self.loop.source_remove(self.switch_id)
+        self.switch_id = self.loop.timeout_add(self.SWITCH_POLL_MS,
+                                               self.switch_ready, started)
+
+    def retarget_link(self):
+        '''follow the peer of the current mode'''
+        address = self.deskflow.peer_address()
+        if self.link is not None and self.link.address == address:
+            return
+        self.link = self.create_link_monitor()
+        if self.link is not None:
+            log(f"link: now probing {self.link.address}")
+            self.link.probe()
+
+    def config_changed(self, changed):
+        if not self.deskflow.running():
+            # picked up on the next start
+            return
+        if all(cf.kind == ConfigFile.LAYOUT for cf in changed):
+            self.deskflow.reload()
+            return
+        log("restarting deskflow for the new configuration")
+        self.stop()
+        self.start()
+
+    def switch_ready(self, started):
+        elapsed = self.loop.monotonic() - started
+        ready = self.deskflow.is_ready()
+        if not ready and elapsed < self.SWITCH_TIMEOUT:
+            return GLib.SOURCE_CONTINUE
+        self.switch_id = None
+        self.switch_done(started, ready)
+        return GLib.SOURCE_REMOVE
+
+    def switch_done(self, started, ready):
+        elapsed = self.loop.monotonic() - started
+        state = "daemon ready" if ready else "daemon not ready"
+        if not self.deskflow.running():
+            state = "daemon stopped"
+        over = " (over budget)" if elapsed > self.SWITCH_BUDGET else ""
+        log("switched to {} mode in {:.3f}s, {}{}".format(
+            self.deskflow.settings.mode, elapsed, state, over))
+        self.metrics.set('applet_mode_switch_seconds', round(elapsed, 3))
 
     @staticmethod
     def collect_garbage():
@@ -421,12 +2291,42 @@ class InputLeapApplication(Gtk.Application):
         return GLib.SOURCE_CONTINUE
 
     def set_icon(self, choice):
-        self.indicator.set_icon_full(*choice)
+        icon, description = choice
+        if self.link is not None and self.link.degraded():
+            description += " (link degraded)"
+        details = self.status_details()
+        if details:
+            description = "\n".join([description] + details)
+        self.indicator.set_icon_full(icon, description)
+        self.history.record(self.deskflow.current_icon, self.loop.time())
+        self.metrics.set('applet_state', self.deskflow.current_icon)
+
+    def status_details(self):
+        details = []
+        if self.deskflow.p is not None:
+            usage = self.watchdog.describe()
+            if usage:
+                details.append(usage)
+            if self.deskflow.effective_scheduling:
+                details.append(", ".join(
+                    f"{k} {v}" for k, v in
+                    self.deskflow.effective_scheduling.items()))
+        clients = self.deskflow.clients
+        if self.deskflow.server_mode and clients.seen():
+            details.append(clients.summary())
+            details.extend(clients.describe(name)
+                           for name in sorted(clients.connected))
+        if self.link is not None:
+            for detail in (self.link.degraded(), self.link.describe()):
+                if detail:
+                    details.append(detail)
+        return details
 
     def start(self):
         # log("TaskBarIcon::start")
         if not self.deskflow.running():
             self.deskflow.start()
+            self.lock_latency(False)
         self.set_icon(self.idle_icon())
 
     def stop(self):
@@ -434,6 +2334,17 @@ class InputLeapApplication(Gtk.Application):
         self.set_icon(self.inhibited_icon())
         if self.deskflow.running():
             self.deskflow.stop()
+            self.lock_latency(True)
+
+    def lock_latency(self, locked):
+        elapsed = self.saver.latency(locked)
+        if elapsed is None:
+            return
+        event = 'lock_to_stop' if locked else 'unlock_to_start'
+        log("{}: {} {:.3f}s".format(self.saver.provider,
+                                    event.replace('_', ' '), elapsed))
+        self.metrics.set(f"applet_{event}_seconds", round(elapsed, 3),
+                         provider=self.saver.provider)
 
     def on_arm_timer(self, event, timeout, item):
         # log('Turn off for {} seconds'.format(timeout))
@@ -442,11 +2353,35 @@ class InputLeapApplication(Gtk.Application):
     def updateIcon(self):
         # log('Timeout')
         if self.deskflow.running(self.deskflow.current_icon):
-            if self.deskflow.has_connection():
+            connected = self.deskflow.has_connection(self.loop.time())
+            if self.deskflow.clients.version != self.clients_version:
+                self.clients_changed()
+            if self.reconnect is not None:
+                self.check_reconnect(connected)
+            if connected:
                 self.set_icon(self.active_icon())
             else:
                 self.set_icon(self.idle_icon())
 
+    def clients_changed(self):
+        clients = self.deskflow.clients
+        self.clients_version = clients.version
+        self.metrics.set('applet_clients_connected', len(clients.connected))
+        for name, client in clients.clients.items():
+            self.metrics.set('applet_client_drops_total', client['drops'],
+                             client=name)
+        if self.menu_clients is None:
+            return
+        submenu = Gtk.Menu()
+        for name in sorted(clients.clients):
+            submenu.append(Gtk.MenuItem(label=clients.describe(name),
+                                        sensitive=False))
+        submenu.show_all()
+        self.menu_clients.set_submenu(submenu)
+        self.menu_clients.set_label(clients.summary())
+        self.menu_clients.set_visible(self.deskflow.server_mode
+                                      and clients.seen())
+
     def service_start_handler(self, *args, **kwargs):
         # log('Turn On')
         self.start()
@@ -465,15 +2400,57 @@ class InputLeapApplication(Gtk.Application):
     def quit_handler(self, *args, **kwargs):
         gtk_quit()
 
+    def retention_timer(self):
+        self.deskflow.retention.check(self.deskflow.log_file)
+        return GLib.SOURCE_CONTINUE
+
+    def history_timer(self):
+        return self.history.flush(self.loop.time())
+
+    def link_timer(self):
+        if self.link is None:
+            for name in ('applet_link_rtt_p50_ms', 'applet_link_rtt_p95_ms',
+                         'applet_link_jitter_ms', 'applet_link_failures_total',
+                         'applet_link_degraded'):
+                self.metrics.set(name, None)
+            return GLib.SOURCE_CONTINUE
+        self.metrics.set('applet_link_rtt_p50_ms', self.link.percentile(50))
+        self.metrics.set('applet_link_rtt_p95_ms', self.link.percentile(95))
+        self.metrics.set('applet_link_jitter_ms', self.link.jitter)
+        self.metrics.set('applet_link_failures_total', self.link.failures)
+        self.metrics.set('applet_link_degraded', int(bool(self.link.degraded())))
+        return self.link.probe()
+
+    def watchdog_timer(self):
+        p = self.deskflow.p
+        if p is None or p.poll() is not None:
+            self.watchdog.reset()
+            return GLib.SOURCE_CONTINUE
+        self.metrics.set('applet_daemon_nice',
+                         self.deskflow.effective_scheduling.get('nice'))
+        reason = self.watchdog.sample(p.pid, self.loop.monotonic())
+        self.metrics.set('applet_daemon_cpu_percent', self.watchdog.cpu_percent())
+        self.metrics.set('applet_daemon_rss_bytes', self.watchdog.rss())
+        self.metrics.set('applet_daemon_open_fds', self.watchdog.fds())
+        if reason is not None:
+            log(f"watchdog: restarting deskflow ({p.pid}): {reason}")
+            self.metrics.inc('applet_daemon_watchdog_restarts_total')
+            self.watchdog.reset()
+            self.delay_handler(None, 1)
+        return GLib.SOURCE_CONTINUE
+
     def stop_delay_timer(self):
         # cancel the prior off
         if self.delay_id is not None:
-            GLib.source_remove(self.delay_id)
+            self.loop.source_remove(self.delay_id)
             self.delay_id = None
 
     def status_timer(self):
         # log('Timeout')
-        if self.follow_screensaver:
+        if self.sleeping or self.idle_paused:
+            # on_wake or on_active decides when to start again
+            pass
+        elif self.follow_screensaver:
             if self.saver.is_locked():
                 if self.deskflow.running():
                     self.stop()
@@ -488,14 +2465,515 @@ class InputLeapApplication(Gtk.Application):
         # another round!
         return GLib.SOURCE_CONTINUE
 
+class ReplayProcess:
+    '''stands in for the daemon's Popen; exits only when the trace says so'''
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -signal.SIGTERM
+
+    def kill(self):
+        self.returncode = -signal.SIGKILL
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+class ReplayDaemon(DeskFlow):
+    def __init__(self, workdir, settings):
+        self.SETTINGS_FILE = workdir / 'deskflow-applet.conf'
+        # everything the daemon reads or writes lives in the work directory
+        for name in ('LOG_DIR', 'CONFIG_DIR'):
+            if hasattr(self, name):
+                setattr(self, name, workdir)
+        self.MODE_FILE = workdir / 'barrier-mode'
+        with open(self.SETTINGS_FILE, 'w') as f:
+            json.dump(dict(self.SETTINGS_DEFAULTS, **settings), f)
+        self.spawned = []
+        self.pids = itertools.count(1000)
+        super().__init__()
+
+    def create_retention(self):
+        return LogRetention(self.settings, background=False)
+
+    def spawn(self, argv, sched=None):
+        self.spawned.append(argv)
+        return ReplayProcess(next(self.pids))
+
+    def kill_others(self, others):
+        pass
+
+    def write_log(self, line):
+        with self.log_file.open('a') as f:
+            f.write(line.rstrip('\n') + '\n')
+
+class ReplayScreensaver(ScreensaverStatus):
+    PROVIDERS = {} # nothing to find, so the state is known from the start
+
+    def __init__(self, locked=False, clock=time.monotonic):
+        super().__init__(None, clock=clock)
+        self.provider = 'replay'
+        self._is_active = locked
+
+    def set_active(self, is_active):
+        self._active_changed(is_active)
+
+class ReplayIndicator:
+    def __init__(self, loop):
+        self.loop = loop
+        self.changes = []
+
+    def set_icon_full(self, icon, description):
+        if not self.changes or self.changes[-1][1] != icon:
+            self.changes.append((self.loop.time(), icon))
+
+    def icon(self):
+        return self.changes[-1][1] if self.changes else None
+
+class ReplayInhibitor:
+    def __init__(self, counts):
+        self.counts = counts
+        self.counts['inhibits'] += 1
+
+    def __del__(self):
+        self.counts['uninhibits'] += 1
+
+class ReplayWatchdog(ResourceWatchdog):
+    '''the simulated pids have no /proc entries to sample'''
+    def _read(self, pid):
+        raise FileNotFoundError(pid)
+
+class ReplayMetrics(Metrics):
+    '''keeps the values but never writes the textfile'''
+    def write(self):
+        return GLib.SOURCE_CONTINUE
+
+class ReplayApplication(InputLeapApplication):
+    '''
+    The real application logic wired to simulated collaborators, driven by
+    a trace on a VirtualLoop.
+
+    A trace is JSON lines.  An optional first line without "t" sets up the
+    run: {"settings": {"mode": "client", ...}, "locked": false,
+    "duration": seconds}.  Every other line has a "t" offset in seconds
+    and one or more of:
+        "lock": true/false    screensaver ActiveChanged
+        "log": "text"         line appended to the daemon log
+        "connect": true/false the daemon logs that its peer (dis)connected
+        "client": "name"      ... in server mode, which client (default peer)
+        "exit": code          the running daemon exits
+        "sleep": true/false   logind PrepareForSleep
+        "network": true/false whether the network is reachable after wake
+        "idle": seconds       the user has been idle this long
+        "active": true        the first input after being idle
+        "menu": "start"|"stop"|"toggle"|"follow"|"delay" (+ "arg": secs)
+                |"server"|"client"
+        "expect": {"spawns": n, "icon": "active"|"idle"|"inactive",
+                   "inhibits": n, "uninhibits": n, "running": bool,
+                   "inhibited": bool, "mode": "server"|"client",
+                   "clients": n, "drops": {"name": n, ...}}
+    '''
+    def __init__(self, header, workdir, loop):
+        self.header = header
+        self.workdir = workdir
+        self.counts = {'inhibits': 0, 'uninhibits': 0}
+        self.network = True
+        super().__init__(loop)
+
+    def create_indicator(self):
+        return ReplayIndicator(self.loop)
+
+    def create_bus(self):
+        return None
+
+    def create_daemon(self):
+        return ReplayDaemon(self.workdir, self.header.get('settings', {}))
+
+    def create_history(self):
+        return ConnectionHistory(self.workdir / 'history.dat')
+
+    def create_metrics(self):
+        return ReplayMetrics(self.workdir / 'metrics.prom')
+
+    def create_watchdog(self):
+        return ReplayWatchdog(self.deskflow.settings)
+
+    def create_link_monitor(self):
+        return None
+
+    def create_config_manager(self):
+        return None
+
+    def create_saver(self):
+        return ReplayScreensaver(self.header.get('locked', False),
+                                 self.loop.monotonic)
+
+    def create_inhibitor(self):
+        return ReplayInhibitor(self.counts)
+
+    def create_system_bus(self):
+        return None
+
+    def create_idle_monitor(self):
+        return None
+
+    def create_menu(self):
+        pass
+
+    def network_available(self):
+        return self.network
+
+    @staticmethod
+    def collect_garbage():
+        # a real collection every 30 simulated seconds would dominate the run
+        return GLib.SOURCE_CONTINUE
+
+    def observed(self):
+        return {
+            'spawns': len(self.deskflow.spawned),
+            'icon': self.indicator.icon().rsplit('-', 1)[-1],
+            'inhibits': self.counts['inhibits'],
+            'uninhibits': self.counts['uninhibits'],
+            'running': self.deskflow.p is not None
+                       and self.deskflow.p.poll() is None,
+            'inhibited': self.screensaver_inhibitor is not None,
+            'mode': self.deskflow.settings.mode,
+            'clients': len(self.deskflow.clients.connected),
+            'drops': {name: client['drops'] for name, client
+                      in self.deskflow.clients.clients.items()},
+        }
+
+    def apply(self, event):
+        '''apply one trace event, returning a list of failed expectations'''
+        if 'lock' in event:
+            self.saver.set_active(bool(event['lock']))
+        if 'log' in event:
+            self.deskflow.write_log(event['log'])
+        if 'connect' in event:
+            self.deskflow.write_log(self.deskflow.connection_line(
+                    bool(event['connect']), event.get('client', 'peer')))
+        if 'network' in event:
+            self.network = bool(event['network'])
+        if 'sleep' in event:
+            if event['sleep']:
+                self.on_sleep()
+            else:
+                self.on_wake()
+        if 'idle' in event:
+            self.on_idle(event['idle'])
+        if event.get('active'):
+            self.on_active()
+        if 'exit' in event and self.deskflow.p is not None:
+            self.deskflow.p.returncode = event['exit']
+        if 'menu' in event:
+            handlers = {
+                'start': self.service_start_handler,
+                'stop': self.service_stop_handler,
+                'toggle': self.service_toggle_handler,
+                'follow': self.set_follow,
+                'delay': lambda: self.delay_handler(None, event.get('arg', 1)),
+                'server': lambda: self.switch_mode(True),
+                'client': lambda: self.switch_mode(False),
+            }
+            handlers[event['menu']]()
+        failures = []
+        if 'expect' in event:
+            observed = self.observed()
+            for key, want in event['expect'].items():
+                if observed.get(key) != want:
+                    failures.append(f"t={event['t']}: {key} = "
+                                    f"{observed.get(key)!r}, expected {want!r}")
+        return failures
+
+    def summary(self):
+        seconds = {}
+        changes = self.indicator.changes + [(self.loop.time(), None)]
+        for (t0, icon), (t1, _) in zip(changes, changes[1:]):
+            seconds[icon] = seconds.get(icon, 0.0) + t1 - t0
+        return dict(self.observed(),
+                    icon_changes=len(self.indicator.changes),
+                    icon_seconds=seconds)
+
+def replay(trace, verbose=False):
+    with open(trace) as f:
+        events = [json.loads(l) for l in f
+                  if l.strip() and not l.lstrip().startswith('#')]
+    header = events.pop(0) if events and 't' not in events[0] else {}
+    events.sort(key=lambda e: e['t'])
+    duration = header.get('duration', events[-1]['t'] if events else 0)
+
+    log.quiet = not verbose
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        loop = VirtualLoop()
+        app = ReplayApplication(header, Path(tmp), loop)
+        for event in events:
+            loop.run_until(loop.epoch + event['t'])
+            failures.extend(app.apply(event))
+        loop.run_until(loop.epoch + duration)
+        result = app.summary()
+        app.deskflow.stop()
+        del app, loop
+        gc.collect()
+    log.quiet = False
+
+    result.update(trace=str(trace),
+                  simulated_seconds=duration,
+                  wall_seconds=round(time.perf_counter() - wall, 4),
+                  cpu_seconds=round(time.process_time() - cpu, 4),
+                  failures=failures)
+    print(json.dumps(result, indent=4))
+    return 1 if failures else 0
+
+class Bench:
+    '''
+    Cost of the code that runs every tick, measured on the replay fakes.
+
+    Each case runs in a forked child so its peak RSS is its own.  The daemon
+    cases start the applet against a synthetic log of the given size, then
+    run one simulated hour with the daemon logging a line every few
+    seconds; the rest time a hot path on its own.  All cases are run
+    several times over, interleaved so a burst of load elsewhere does not
+    hit every run of one case, and the best figures are kept.  Results are compared with
+    a JSON baseline, and a case fails if it is slower, or bigger, than the
+    baseline by more than the tolerance and by more than the noise floor.
+    '''
+    BASELINE = Path.home() / '.config' / 'Deskflow' / 'deskflow-applet-bench.json'
+    SIZES_MB = (1, 16, 256, 1024)
+    TOLERANCE = 0.25
+    REPEAT = 5
+    # smaller differences are noise, whatever the tolerance
+    FLOOR = {'us_per_call': 5.0, 'cpu_s_per_sim_hour': 0.1, 'peak_rss_mb': 4.0}
+    CALLS = 20000
+    LOG_INTERVAL = 5 # seconds between daemon log lines
+    NOISE = ("[2025-12-16T13:06:38.629] DEBUG: screen \"peer\" updated "
+             "clipboard 0 (seq {}), fill {} bytes\n")
+
+    def __init__(self, sizes=None, baseline=None, tolerance=None,
+                 repeat=None):
+        self.sizes = sizes or self.SIZES_MB
+        self.baseline = Path(baseline) if baseline else self.BASELINE
+        self.tolerance = self.TOLERANCE if tolerance is None else tolerance
+        self.repeat = max(1, repeat or self.REPEAT)
+
+    @staticmethod
+    def fork(case, *args):
+        '''run case(*args) in a child, returning its results and peak RSS'''
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            try:
+                result = case(*args)
+                result['peak_rss_mb'] = round(
+                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            except Exception:
+                result = {'error': traceback.format_exc()}
+            try:
+                os.write(w, json.dumps(result).encode())
+            finally:
+                os._exit(0)
+        os.close(w)
+        with os.fdopen(r) as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        return json.loads(data) if data else {'error': 'case crashed'}
+
+    @staticmethod
+    def best(runs):
+        '''the lowest of each figure over several runs of one case'''
+        for result in runs:
+            if 'error' in result:
+                return result
+        best = dict(runs[0])
+        for key, value in best.items():
+            if isinstance(value, (int, float)):
+                best[key] = min(result[key] for result in runs)
+        return best
+
+    def fill(self, path, size_mb, last_line):
+        block = ''.join(self.NOISE.format(i, i * 7) for i in range(10000))
+        block = block.encode()[:1 << 20]
+        block = block[:block.rindex(b'\n') + 1]
+        with open(path, 'ab') as f:
+            written = 0
+            while written < size_mb << 20:
+                f.write(block)
+                written += len(block)
+            f.write(f"{last_line}\n".encode())
+
+    def daemon_case(self, size_mb):
+        with tempfile.TemporaryDirectory() as tmp:
+            loop = VirtualLoop()
+            header = {'settings': {'log_max_mb': size_mb * 2 + 1}}
+            app = ReplayApplication(header, Path(tmp), loop)
+            self.fill(app.deskflow.log_file, size_mb,
+                      app.deskflow.connection_line(True))
+            seq = itertools.count()
+            def daemon_line():
+                app.deskflow.write_log(self.NOISE.format(next(seq), 0))
+                return GLib.SOURCE_CONTINUE
+            loop.timeout_add_seconds(self.LOG_INTERVAL, daemon_line)
+            cpu = time.process_time()
+            loop.run_until(loop.now + 3600)
+            cpu = time.process_time() - cpu
+            icon = app.indicator.icon()
+            app.deskflow.stop()
+        return {'cpu_s_per_sim_hour': round(cpu, 4), 'icon': icon}
+
+    def calls_case(self, name):
+        with tempfile.TemporaryDirectory() as tmp:
+            loop = VirtualLoop()
+            app = ReplayApplication({}, Path(tmp), loop)
+            settings = app.deskflow.settings
+            paths = {
+                'status_timer': app.status_timer,
+                'running': app.deskflow.running,
+                'has_connection': app.deskflow.has_connection,
+                'set_icon': lambda: app.set_icon(app.idle_icon()),
+                'settings_save_load': lambda: (settings.save(), settings.load()),
+                'log': lambda: log("bench"),
+            }
+            call = paths[name]
+            log.quiet = name != 'log'
+            stream, log.file = log.file, open(os.devnull, 'w')
+            try:
+                cpu = time.process_time()
+                for _ in range(self.CALLS):
+                    call()
+                cpu = time.process_time() - cpu
+            finally:
+                log.file.close()
+                log.file = stream
+                log.quiet = True
+            app.deskflow.stop()
+        return {'us_per_call': round(cpu / self.CALLS * 1e6, 3)}
+
+    def run(self):
+        cases = {}
+        for size in self.sizes:
+            cases[f"daemon_{size}mb"] = (self.daemon_case, size)
+        for name in ('status_timer', 'running', 'has_connection', 'set_icon',
+                     'settings_save_load', 'log'):
+            cases[name] = (self.calls_case, name)
+        runs = {name: [] for name in cases}
+        log.quiet = True
+        try:
+            for i in range(self.repeat):
+                for name, (case, arg) in cases.items():
+                    runs[name].append(self.fork(case, arg))
+                    print(f"{name} ({i + 1}/{self.repeat}): {runs[name][-1]}",
+                          file=sys.stderr)
+        finally:
+            log.quiet = False
+        return {name: self.best(results) for name, results in runs.items()}
+
+    def compare(self, results):
+        '''regressions against the stored baseline, as messages'''
+        try:
+            with open(self.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            return None
+        regressions = []
+        for name, result in results.items():
+            if 'error' in result:
+                regressions.append(f"{name}: {result['error']}")
+            for key, value in result.items():
+                base = baseline.get(name, {}).get(key)
+                if not isinstance(value, (int, float)) or not base:
+                    continue
+                if (value > base * (1 + self.tolerance)
+                        and value - base > self.FLOOR.get(key, 0)):
+                    regressions.append(
+                        f"{name}: {key} {value} over baseline {base} "
+                        f"by more than {self.tolerance:.0%}")
+        return regressions
+
+    def save(self, results):
+        self.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+
+def bench(sizes=None, baseline=None, tolerance=None, update=False,
+          repeat=None):
+    b = Bench(sizes, baseline, tolerance, repeat)
+    results = b.run()
+    regressions = None if update else b.compare(results)
+    if regressions is None:
+        b.save(results)
+        log(f"bench: baseline written to {b.baseline}")
+        regressions = []
+    for r in regressions:
+        log(f"bench: regression: {r}")
+    print(json.dumps(dict(results, regressions=regressions), indent=4))
+    return 1 if regressions else 0
+
 def gtk_quit(*args, **kwargs):
     Gtk.main_quit()
 
 def main():
+    parser = argparse.ArgumentParser(
+            description='applet for controlling deskflow based on screensaver activity')
+    parser.add_argument('--history', type=int, nargs='?', const=7,
+                        metavar='DAYS',
+                        help='print connection history for the last DAYS days (default 7) and exit')
+    parser.add_argument('--replay', metavar='TRACE', nargs='+',
+                        help='run the applet logic against recorded traces on a virtual clock and exit')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the applet log while replaying')
+    parser.add_argument('--bench', type=str, nargs='?', const='',
+                        metavar='SIZES',
+                        help='benchmark the per-tick hot paths against daemon logs of SIZES MB '
+                             '(comma separated, default 1,16,256,1024), compare with the baseline and exit')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help=f'benchmark baseline (default {Bench.BASELINE})')
+    parser.add_argument('--tolerance', type=float, metavar='FRACTION',
+                        help=f'allowed slowdown over the baseline (default {Bench.TOLERANCE})')
+    parser.add_argument('--repeat', type=int, metavar='N',
+                        help=f'runs of each benchmark case, keeping the best (default {Bench.REPEAT})')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the benchmark results as the new baseline')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every main-loop callback, watch for stalls and report on SIGUSR2')
+    args = parser.parse_args()
+    if args.replay or args.bench is not None:
+        # keep stdout for the JSON results
+        log.file = sys.stderr
+    if args.history is not None:
+        ConnectionHistory().report(max(1, args.history))
+        return
+    if args.replay:
+        sys.exit(max([replay(trace, args.verbose) for trace in args.replay]))
+    if args.bench is not None:
+        sizes = [int(s) for s in args.bench.split(',') if s]
+        sys.exit(bench(sizes, args.baseline, args.tolerance,
+                       args.update_baseline, args.repeat))
+    if NO_DESKTOP is not None:
+        sys.exit(f"cannot start the applet without Gtk and AppIndicator3: "
+                 f"{NO_DESKTOP}")
+
     DBusGMainLoop(set_as_default=True)
     signal.signal(signal.SIGINT, gtk_quit)
-    app = InputLeapApplication()
+    app = InputLeapApplication(profile=args.profile)
+
+    def terminate(signum):
+        # logout and kill end the session here, not through the Exit item
+        log(f"terminating on signal {signum}")
+        app.history.close(DeskFlow.INACTIVE)
+        gtk_quit()
+        return GLib.SOURCE_REMOVE
+    for signum in (signal.SIGTERM, signal.SIGHUP):
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signum, terminate, signum)
     Gtk.main()
+    app.history.close(DeskFlow.INACTIVE)
 
 if __name__ == '__main__':
     main()
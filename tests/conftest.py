@@ -0,0 +1,32 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+APPLETS = ['deskflow-applet.py', 'input-leap-applet.py']
+
+
+def load(name):
+    '''import one of the applet scripts as a module'''
+    pytest.importorskip('dbus')
+    pytest.importorskip('gi')
+    spec = importlib.util.spec_from_file_location(
+        name[:-len('.py')].replace('-', '_'), ROOT / name)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ValueError as e:
+        # gi.require_version() without the typelibs installed
+        pytest.skip(str(e))
+    return module
+
+
+@pytest.fixture(scope='session', params=APPLETS)
+def applet(request):
+    return load(request.param)
+
+
+def daemon(app):
+    '''the application's daemon supervisor, whichever applet it is'''
+    return app.deskflow if hasattr(app, 'deskflow') else app.input_leap
@@ -0,0 +1,31 @@
+import json
+
+
+def test_best_of_runs(applet):
+    runs = [{'us_per_call': 4.9, 'peak_rss_mb': 20.0, 'icon': 'a'},
+            {'us_per_call': 3.3, 'peak_rss_mb': 21.0, 'icon': 'b'}]
+    assert applet.Bench.best(runs) == {
+        'us_per_call': 3.3, 'peak_rss_mb': 20.0, 'icon': 'a'}
+    failed = {'error': 'case crashed'}
+    assert applet.Bench.best(runs + [failed]) == failed
+
+
+def test_compare(applet, tmp_path):
+    baseline = tmp_path / 'bench.json'
+    baseline.write_text(json.dumps({
+        'has_connection': {'us_per_call': 3.3},
+        'status_timer': {'us_per_call': 10.0},
+        'daemon_16mb': {'cpu_s_per_sim_hour': 0.17, 'peak_rss_mb': 24.0},
+    }))
+    bench = applet.Bench(baseline=baseline)
+    # over the tolerance, but within the noise floor
+    assert bench.compare({
+        'has_connection': {'us_per_call': 4.9},
+        'daemon_16mb': {'cpu_s_per_sim_hour': 0.26, 'peak_rss_mb': 26.0},
+    }) == []
+    regressions = bench.compare({
+        'status_timer': {'us_per_call': 20.0},
+        'daemon_16mb': {'cpu_s_per_sim_hour': 0.5, 'peak_rss_mb': 24.0},
+    })
+    assert [r.split(':')[0] for r in regressions] == ['status_timer',
+                                                      'daemon_16mb']
@@ -0,0 +1,53 @@
+import pytest
+
+LAYOUT = '''\
+section: screens
+    a:
+    b:
+        halfDuplexCapsLock = true
+end
+section: links
+    a:
+        right = b
+    b:
+        left = a
+end
+'''
+SETTINGS = '''\
+[General]
+serverHostname=a
+screenName = b
+'''
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'conf'
+    path.write_text(text)
+    return path
+
+
+@pytest.mark.parametrize('kind, text, cosmetic, effective', [
+    ('LAYOUT', LAYOUT,
+     [('right = b', 'right=b  # to the right'),
+      ('halfDuplexCapsLock = true', 'halfDuplexCapsLock= true'),
+      ('section: links', '# moved\nsection:links # the links')],
+     [('right = b', 'right = c'), ('halfDuplexCapsLock = true', '')]),
+    ('SETTINGS', SETTINGS,
+     [('screenName = b', 'screenName=b ; mine'),
+      ('serverHostname=a', '# server\nserverHostname = a')],
+     [('screenName = b', 'screenName = c'),
+      ('serverHostname=a', 'serverHostname=a#1')]),
+])
+def test_digest(applet, tmp_path, kind, text, cosmetic, effective):
+    kind = getattr(applet.ConfigFile, kind)
+    path = write(tmp_path, text)
+    config = applet.ConfigFile(path, kind)
+    digest = config.digest()
+    assert config.validate() is None
+    for old, new in cosmetic:
+        path.write_text(text.replace(old, new))
+        assert config.digest() == digest, new
+        assert config.validate() is None
+    for old, new in effective:
+        path.write_text(text.replace(old, new))
+        assert config.digest() != digest, new
@@ -0,0 +1,108 @@
+import io
+import os
+from datetime import datetime
+
+import pytest
+
+NOON = datetime(2026, 1, 10, 12).timestamp()
+HOUR = 3600
+
+
+@pytest.fixture
+def states(applet):
+    '''the daemon class, for its INACTIVE/ACTIVE/IDLE states'''
+    return getattr(applet, 'DeskFlow', None) or applet.Input_Leap
+
+
+def journal(applet, tmp_path, records, now=None):
+    history = applet.ConnectionHistory(tmp_path / 'history.dat')
+    for when, state in records:
+        history.record(state, when)
+    history.flush(now)
+    return history
+
+
+def test_events(applet, states, tmp_path):
+    history = journal(applet, tmp_path, [
+        (NOON - 3 * HOUR, states.ACTIVE),
+        (NOON - 2 * HOUR, states.IDLE),
+        (NOON - HOUR, states.ACTIVE),
+        (NOON, states.INACTIVE),
+    ])
+    assert list(history.events(NOON - 2.5 * HOUR, NOON)) == [
+        (NOON - 2.5 * HOUR, states.ACTIVE),
+        (NOON - 2 * HOUR, states.IDLE),
+        (NOON - HOUR, states.ACTIVE),
+    ]
+    assert list(history.events(NOON - 4 * HOUR, NOON - 3 * HOUR)) == []
+    assert list(history.events(NOON + HOUR, NOON + 2 * HOUR)) == [
+        (NOON + HOUR, states.INACTIVE)]
+
+
+def test_summary(applet, states, tmp_path):
+    history = journal(applet, tmp_path, [
+        (NOON - 4 * HOUR, states.ACTIVE),
+        (NOON - 3 * HOUR, states.IDLE),
+        (NOON - 3 * HOUR + 30, states.ACTIVE),
+        (NOON - 2 * HOUR, states.IDLE),
+        (NOON - HOUR, states.INACTIVE),
+        (NOON - HOUR / 2, states.ACTIVE),
+    ])
+    yesterday, today = history.summary(2, now=NOON)
+    assert yesterday['seconds'] == [0.0, 0.0, 0.0]
+    assert today['day'] == '2026-01-10'
+    assert today['seconds'][states.ACTIVE] == 2.5 * HOUR - 30
+    assert today['seconds'][states.IDLE] == HOUR + 30
+    # a stop cancels the pending reconnect after the second drop
+    assert today['drops'] == 2
+    assert today['reconnects'] == [30]
+
+
+def test_compact(applet, states, tmp_path):
+    day = 86400
+    history = journal(applet, tmp_path, [
+        (NOON - 200 * day, states.ACTIVE),
+        (NOON - 190 * day, states.IDLE),
+        (NOON - day, states.ACTIVE),
+    ])
+    with open(history.fn, 'ab') as f:
+        f.write(b'torn')
+    os.utime(history.fn, (NOON - HOUR, NOON - HOUR))
+    history.compact(NOON)
+    cutoff = NOON - 180 * day
+    assert list(history.events(0, NOON)) == [
+        (cutoff, states.IDLE), (NOON - day, states.ACTIVE)]
+    assert os.path.getsize(history.fn) == 2 * history.RECORD.size
+    assert os.stat(history.fn).st_mtime == NOON - HOUR
+
+
+def test_recover_after_crash(applet, states, tmp_path):
+    journal(applet, tmp_path, [(NOON - 4 * HOUR, states.ACTIVE)],
+            now=NOON - 3 * HOUR)
+    # the applet died without close(); looking at the report changes nothing
+    history = applet.ConnectionHistory(tmp_path / 'history.dat')
+    history.report(1, out=io.StringIO())
+    assert os.stat(history.fn).st_mtime == NOON - 3 * HOUR
+
+    history.compact(NOON)
+    history.recover()
+    assert list(history.events(0, NOON)) == [
+        (NOON - 4 * HOUR, states.ACTIVE),
+        (NOON - 3 * HOUR, states.INACTIVE)]
+    (today,) = history.summary(1, now=NOON)
+    assert today['seconds'][states.ACTIVE] == HOUR
+
+    # a closed journal is left alone
+    history.recover()
+    assert os.path.getsize(history.fn) == 2 * history.RECORD.size
+
+
+
+def test_percentile(applet):
+    percentile = applet.ConnectionHistory.percentile
+    assert percentile([], 50) is None
+    assert percentile([1, 2], 50) == 1
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 21)), 95) == 19
+    assert percentile(list(range(1, 21)), 99) == 20
+    assert percentile([7], 1) == 7
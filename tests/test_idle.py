@@ -0,0 +1,75 @@
+import itertools
+
+
+class FakeMutter:
+    '''Mutter's IdleMonitor, holding AddUserActiveWatch replies until told'''
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.pending = []
+
+    def AddIdleWatch(self, interval, reply_handler, error_handler):
+        reply_handler(next(self.ids))
+
+    def AddUserActiveWatch(self, reply_handler, error_handler):
+        self.pending.append((next(self.ids), reply_handler))
+
+    def reply(self):
+        watch, reply_handler = self.pending.pop(0)
+        reply_handler(watch)
+        return watch
+
+
+class FakeBus:
+    def __init__(self, mutter):
+        self.mutter = mutter
+        self.receivers = []
+
+    def name_has_owner(self, name):
+        return name == 'org.gnome.Mutter.IdleMonitor'
+
+    def add_signal_receiver(self, handler, **match):
+        self.receivers.append(handler)
+
+    def get_object(self, name, path, introspect=True):
+        return self.mutter
+
+
+def monitor(applet, monkeypatch):
+    monkeypatch.setattr(applet.dbus, 'Interface', lambda proxy, name: proxy)
+    mutter = FakeMutter()
+    bus = FakeBus(mutter)
+    events = []
+    idle = applet.IdleMonitor(bus, None, [300, 60],
+                              lambda seconds: events.append(seconds),
+                              lambda: events.append('active'))
+    return mutter, bus.receivers[0], idle, events
+
+
+def test_active_after_reply(applet, monkeypatch):
+    mutter, fire, idle, events = monitor(applet, monkeypatch)
+    assert sorted(idle.watches.values()) == [60, 300]
+    fire(1)
+    fire(2)
+    watch = mutter.reply()
+    assert idle.active_watch == watch
+    fire(watch)
+    assert events == [60, 300, 'active']
+    assert not idle.idle
+
+
+def test_active_before_reply(applet, monkeypatch):
+    mutter, fire, idle, events = monitor(applet, monkeypatch)
+    fire(1)
+    # the user is back before Mutter has told us the active watch's id
+    fire(3)
+    assert events == [60]
+    mutter.reply()
+    assert events == [60, 'active']
+    assert not idle.idle
+    assert idle.active_watch is None
+
+    fire(1)
+    assert events == [60, 'active', 60]
+    watch = mutter.reply()
+    fire(watch)
+    assert events == [60, 'active', 60, 'active']
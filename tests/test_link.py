@@ -0,0 +1,92 @@
+import socket
+import threading
+import time
+
+import pytest
+
+SETTINGS = {'link_rtt_warn_ms': 50, 'link_jitter_warn_ms': 20}
+
+
+@pytest.fixture
+def listener():
+    # a backlog of 0 queues a single connection, so a second one waits
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    s.listen(0)
+    yield s
+    s.close()
+
+
+def drain(listener):
+    '''accept whatever is queued, so the next connect is answered at once'''
+    listener.setblocking(False)
+    try:
+        while True:
+            listener.accept()[0].close()
+    except BlockingIOError:
+        pass
+
+
+def probe(applet, monitor, stall=0.0):
+    '''one probe, with the main loop stalled for stall seconds'''
+    monitor.probe()
+    time.sleep(stall)
+    context = applet.GLib.MainContext.default()
+    deadline = time.monotonic() + 2 * monitor.TIMEOUT
+    while monitor.started is not None and time.monotonic() < deadline:
+        context.iteration(True)
+    assert monitor.started is None
+
+
+def test_rtt_and_jitter(applet):
+    monitor = applet.LinkMonitor('peer', SETTINGS)
+    for _ in range(10):
+        monitor.add(5)
+    assert monitor.degraded() is None
+    assert monitor.jitter == 0
+    for _ in range(10):
+        monitor.add(200)
+    assert monitor.degraded().startswith('rtt p95 200.0 ms')
+
+    monitor = applet.LinkMonitor('peer', SETTINGS)
+    for rtt in [1, 41] * 10:
+        monitor.add(rtt)
+    assert monitor.percentile(95) == 41
+    assert monitor.degraded().startswith('jitter')
+
+
+def test_single_outlier(applet):
+    '''one slow probe in a full window is not the p95'''
+    monitor = applet.LinkMonitor('peer', SETTINGS)
+    monitor.add(500)
+    for _ in range(monitor.WINDOW - 1):
+        monitor.add(5)
+    assert monitor.percentile(95) == 5
+    assert monitor.percentile(100) == 500
+    assert monitor.degraded() is None
+
+
+def test_probe_loopback(applet, listener):
+    host, port = listener.getsockname()
+    monitor = applet.LinkMonitor(f'{host}:{port}', SETTINGS)
+    # a busy main loop is not a slow network
+    for stall in (0, 0.2, 0.2):
+        probe(applet, monitor, stall)
+        drain(listener)
+    assert len(monitor.samples) == 3 and not monitor.failed
+    assert monitor.percentile(100) < 50
+    assert monitor.degraded() is None
+
+    # with the accept queue full the SYN goes unanswered until it is drained
+    # and the kernel retransmits it, about a second later
+    waiting = socket.create_connection((host, port))
+    threading.Timer(0.2, drain, [listener]).start()
+    probe(applet, monitor)
+    waiting.close()
+    assert monitor.samples[-1] >= 200
+    assert monitor.degraded().startswith('rtt p95')
+
+    listener.close()
+    probe(applet, monitor)
+    assert monitor.failed and monitor.failures == 1
+    assert monitor.degraded() == f'{host}:{port} unreachable'
@@ -0,0 +1,37 @@
+import gc
+
+from conftest import daemon
+
+
+class FakeLink:
+    def __init__(self, address):
+        self.address = address
+        self.probes = 0
+
+    def probe(self):
+        self.probes += 1
+
+    def degraded(self):
+        return None
+
+    def describe(self):
+        return ''
+
+
+def test_link_follows_mode(applet, tmp_path):
+    class Application(applet.ReplayApplication):
+        def create_link_monitor(self):
+            address = daemon(self).peer_address()
+            return None if address is None else FakeLink(address)
+
+    app = Application({'settings': {'mode': 'client'}}, tmp_path,
+                      applet.VirtualLoop())
+    for server_mode in (True, False, True):
+        app.switch_mode(server_mode)
+        address = daemon(app).peer_address()
+        assert (app.link and app.link.address) == address
+        if app.link is not None:
+            assert app.link.probes >= 1
+    daemon(app).stop()
+    del app
+    gc.collect()
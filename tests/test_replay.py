@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import ROOT
+
+TRACES = sorted((ROOT / 'traces').glob('*.jsonl'))
+
+
+@pytest.mark.parametrize('trace', TRACES, ids=lambda p: p.stem)
+def test_trace(applet, trace, capsys):
+    status = applet.replay(trace)
+    assert status == 0, capsys.readouterr().out
+
+
+def fakes(name):
+    '''the replay and bench fakes of one applet, up to its main()'''
+    text = (ROOT / name).read_text()
+    return text[text.index('class ReplayProcess'):text.index('def gtk_quit')]
+
+
+def test_fakes_match():
+    '''both applets carry the same fakes, apart from the daemon's name'''
+    text = fakes('deskflow-applet.py')
+    for old, new in [('.deskflow', '.input_leap'), ('DeskFlow', 'Input_Leap'),
+                     ("'Deskflow'", "'input-leap'"), ('deskflow', 'input-leap')]:
+        text = text.replace(old, new)
+    assert text == fakes('input-leap-applet.py')
+
+
+def test_replay_screensaver_is_complete(applet):
+    '''the replay screensaver has every field of a real one'''
+    real = applet.ScreensaverStatus(None, provider='logind')
+    replay = applet.ReplayScreensaver(locked=True)
+    assert vars(replay).keys() == vars(real).keys()
+    assert replay.is_locked() and replay.ready
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def daemon():
+    p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    yield p
+    p.kill()
+    p.wait()
+
+
+def test_applied_from_the_applet(applet, daemon):
+    cpu = min(os.sched_getaffinity(0))
+    sched = applet.Scheduling({'nice': os.getpriority(os.PRIO_PROCESS, 0) + 3,
+                               'ioprio': 'idle', 'cpu_affinity': [cpu]})
+    sched.apply(daemon.pid)
+    effective = sched.report(daemon.pid)
+    assert effective['nice'] == sched.nice
+    assert effective['cpus'] == [cpu]
+    if sched.syscalls is not None:
+        assert effective['ioprio'].startswith('idle:')
+
+
+@pytest.mark.parametrize('value', ['best effort:0', 'idle:x', 'realtime:9'])
+def test_bad_ioprio_is_ignored(applet, value):
+    assert applet.Scheduling({'ioprio': value}).ioprio is None
+
+
+def test_ioprio(applet):
+    sched = applet.Scheduling({'ioprio': 'best-effort:4'})
+    assert sched.ioprio == (2 << sched.IOPRIO_CLASS_SHIFT) | 4
+
+
+@pytest.mark.parametrize('options', [
+    {'nice': '5'}, {'nice': 5.0}, {'nice': True}, {'nice': 40},
+    {'cpu_affinity': '0-3'}, {'cpu_affinity': []}, {'cpu_affinity': [0, 'x']},
+    {'cpu_affinity': [-1]}, {'cgroup': 'deskflow'},
+])
+def test_bad_options_are_ignored(applet, daemon, options):
+    sched = applet.Scheduling(options)
+    assert (sched.nice, sched.cpus, sched.cgroup) == (None, None, None)
+    sched.prepare()
+    sched.apply(daemon.pid)
@@ -0,0 +1,91 @@
+import gc
+
+import pytest
+
+from conftest import daemon
+
+
+class FakeObject:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def GetActive(self, dbus_interface, reply_handler, error_handler):
+        self.calls.append((reply_handler, error_handler))
+
+
+class FakeBus:
+    '''a session bus where only the freedesktop screensaver is running'''
+    def __init__(self):
+        self.calls = []
+        self.receivers = []
+
+    def name_has_owner(self, name):
+        return name == 'org.freedesktop.ScreenSaver'
+
+    def add_signal_receiver(self, handler, **match):
+        self.receivers.append(handler)
+
+    def get_object(self, name, path, introspect=True):
+        return FakeObject(self.calls)
+
+
+def saver(applet):
+    bus = FakeBus()
+    status = applet.ScreensaverStatus(bus)
+    events = []
+    status.ready_callback(lambda: events.append(('ready', status.is_locked())))
+    status.lock_callback(lambda: events.append('lock'))
+    status.unlock_callback(lambda: events.append('unlock'))
+    return bus, status, events
+
+
+def test_initial_state(applet):
+    bus, status, events = saver(applet)
+    assert status.provider == 'freedesktop'
+    assert events == []
+    reply, error = bus.calls[0]
+    reply(True)
+    assert events == [('ready', True)]
+    assert status.latency(True) is None
+    bus.receivers[0](False)
+    assert events == [('ready', True), 'unlock']
+
+
+def test_signal_before_reply(applet):
+    bus, status, events = saver(applet)
+    reply, error = bus.calls[0]
+    bus.receivers[0](True)
+    reply(False)
+    assert events == [('ready', True)]
+    assert status.is_locked()
+
+
+def test_error(applet):
+    bus, status, events = saver(applet)
+    reply, error = bus.calls[0]
+    error(Exception('no reply'))
+    assert events == [('ready', False)]
+
+
+@pytest.mark.parametrize('locked', [True, False])
+def test_start_waits_for_lock_state(applet, tmp_path, locked):
+    bus = FakeBus()
+
+    class Application(applet.ReplayApplication):
+        def create_saver(self):
+            return applet.ScreensaverStatus(bus)
+
+    app = Application({'settings': {'follow_screensaver': True}}, tmp_path,
+                      applet.VirtualLoop())
+    assert not daemon(app).running()
+    reply, error = bus.calls[0]
+    reply(locked)
+    assert daemon(app).running() is not locked
+    daemon(app).stop()
+    del app
+    gc.collect()
+
+
+def test_unknown_provider(applet):
+    status = applet.ScreensaverStatus(FakeBus(), provider='xscreensaver')
+    assert status.provider == 'freedesktop'
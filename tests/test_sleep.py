@@ -0,0 +1,112 @@
+import os
+import select
+import shutil
+import subprocess
+import time
+
+import pytest
+
+MANAGER = 'org.freedesktop.login1.Manager'
+
+
+@pytest.fixture
+def system_bus(applet):
+    '''a private bus standing in for the system bus, one per test
+
+    libdbus reads DBUS_SYSTEM_BUS_ADDRESS once per process, so the monitor
+    connects to the address directly rather than through dbus.SystemBus().
+    '''
+    if shutil.which('dbus-daemon') is None:
+        pytest.skip('no dbus-daemon')
+    applet.DBusGMainLoop(set_as_default=True)
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                               '--print-address'],
+                              stdout=subprocess.PIPE, text=True)
+    address = daemon.stdout.readline().strip()
+    yield address
+    daemon.terminate()
+    daemon.wait()
+
+
+@pytest.fixture
+def logind(applet, system_bus):
+    '''a fake logind handing out delay inhibitors as pipes'''
+    import dbus.service
+
+    class Logind(dbus.service.Object):
+        def __init__(self, bus):
+            super().__init__(bus, '/org/freedesktop/login1')
+            self.name = dbus.service.BusName('org.freedesktop.login1', bus)
+            self.inhibitors = []
+
+        @dbus.service.method(MANAGER, in_signature='ssss',
+                             out_signature='h')
+        def Inhibit(self, what, who, why, mode):
+            assert (what, mode) == ('sleep', 'delay')
+            r, w = os.pipe()
+            self.inhibitors.append(r)
+            fd = applet.dbus.types.UnixFd(w)
+            os.close(w)
+            return fd
+
+        @dbus.service.signal(MANAGER, signature='b')
+        def PrepareForSleep(self, start):
+            pass
+
+    bus = applet.dbus.bus.BusConnection(system_bus)
+    fake = Logind(bus)
+    yield fake
+    for fd in fake.inhibitors:
+        os.close(fd)
+    bus.close()
+
+
+def released(fd):
+    '''whether every copy of an inhibitor's write end has been closed'''
+    return (select.select([fd], [], [], 0)[0] != []
+            and os.read(fd, 1) == b'')
+
+
+def run(applet, condition, timeout=5):
+    context = applet.GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        context.iteration(False)
+        time.sleep(0.001)
+    assert condition()
+
+
+def test_sleep_and_wake(applet, system_bus, logind):
+    events = []
+    monitor = applet.SleepMonitor(applet.dbus.bus.BusConnection(system_bus),
+                                  lambda: events.append('sleep'),
+                                  lambda: events.append('wake'))
+    run(applet, lambda: monitor.fd is not None)
+    assert len(logind.inhibitors) == 1
+    assert not released(logind.inhibitors[0])
+
+    logind.PrepareForSleep(True)
+    run(applet, lambda: events == ['sleep'])
+    assert monitor.fd is None
+    run(applet, lambda: released(logind.inhibitors[0]))
+
+    logind.PrepareForSleep(False)
+    run(applet, lambda: events == ['sleep', 'wake'] and monitor.fd is not None)
+    assert len(logind.inhibitors) == 2
+    assert not released(logind.inhibitors[1])
+    monitor.release()
+    monitor.bus.close()
+
+
+def test_inhibitor_after_sleep(applet, system_bus, logind):
+    '''an inhibitor granted once the machine is going down is dropped'''
+    events = []
+    monitor = applet.SleepMonitor(applet.dbus.bus.BusConnection(system_bus),
+                                  lambda: events.append('sleep'),
+                                  lambda: events.append('wake'))
+    monitor._prepare_for_sleep(True)
+    run(applet, lambda: not monitor.pending)
+    assert events == ['sleep']
+    assert monitor.fd is None
+    run(applet, lambda: released(logind.inhibitors[0]))
+    monitor.bus.close()
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+
+@pytest.fixture
+def child():
+    '''start a stub daemon running the given Python code'''
+    children = []
+
+    def spawn(code):
+        p = subprocess.Popen([sys.executable, '-c', code])
+        children.append(p)
+        return p
+    yield spawn
+    for p in children:
+        p.kill()
+        p.wait()
+
+
+def sample(watchdog, pid, count, interval=0.5):
+    reason = None
+    for _ in range(count):
+        reason = watchdog.sample(pid, time.monotonic()) or reason
+        time.sleep(interval)
+    return reason
+
+
+def test_busy_child_is_restarted(applet, child):
+    p = child('while True: pass')
+    watchdog = applet.ResourceWatchdog({'watchdog_cpu_percent': 50,
+                                        'watchdog_cpu_seconds': 1})
+    reason = sample(watchdog, p.pid, 3)
+    assert reason is not None and reason.startswith('cpu over 50%')
+
+
+def test_idle_child_is_left_alone(applet, child):
+    p = child('import time; time.sleep(60)')
+    # shorter than one sampling interval, which used to leave a single
+    # sample in the window and restart on every tick
+    watchdog = applet.ResourceWatchdog({'watchdog_cpu_seconds': 4})
+    assert watchdog.samples.maxlen >= 2
+    assert sample(watchdog, p.pid, 3) is None
+
+
+def test_rss_limit(applet, child):
+    p = child('import time; x = bytearray(64 << 20); time.sleep(60)')
+    time.sleep(0.5)
+    watchdog = applet.ResourceWatchdog({'watchdog_rss_mb': 16.5})
+    assert watchdog.rss_limit == int(16.5 * (1 << 20))
+    reason = watchdog.sample(p.pid, time.monotonic())
+    assert reason is not None and reason.startswith('rss')
+
+
+def test_bad_settings_fall_back(applet, child):
+    ResourceWatchdog = applet.ResourceWatchdog
+    watchdog = ResourceWatchdog({'watchdog_rss_mb': '512',
+                                 'watchdog_cpu_seconds': '60',
+                                 'watchdog_cpu_percent': None,
+                                 'watchdog_fd_warn': True})
+    assert watchdog.rss_limit == ResourceWatchdog.RSS_MB << 20
+    assert watchdog.cpu_seconds == ResourceWatchdog.CPU_SECONDS
+    assert watchdog.cpu_limit == ResourceWatchdog.CPU_PERCENT
+    assert watchdog.fd_warn == ResourceWatchdog.FD_WARN
+    p = child('import time; time.sleep(60)')
+    assert sample(watchdog, p.pid, 2) is None